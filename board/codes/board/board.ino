@@ -17,9 +17,15 @@
 // * CANからID:CAN_BLINKの1byteのメッセージを受け取り、かつ、blink_state==trueなら、STONEに点滅指示をする。
 //   * メッセージが0ならノーマル表示を通知
 //   * それ以外なら色付き表示を通知
+// * CANからID:CAN_BLINKの8byteのメッセージを受け取り、1byte目がSET_BULK_STATEなら、複数の碁石の状態から自分の状態を取り出す。
+//   * 2byte目が行、3byte目の下位4bitが列の区切り（列 10p+1〜10p+10）で、自分の行と区切りでなければ無視
+//   * 4byte目以降に1交点4bit（色 | 感情 << 2）で列の順に下位4bitから詰めてある
+//   * 碁石が装着されていて空点でなければ、最後に受け取った向きと合わせてSET_STATEとしてSTONEに通知する
+// * CANの割り込みのたびに、MCP2515の受信バッファが空になるまでメッセージを読み出す（まとめて届いたフレームを取りこぼさない）
 // * D2ピンが100ms以上HIGHなら、CANに脱着(NOTIFY_DETACH)を示すメッセージをID:CAN_NOTIFYで送る。
 // * D2ピンがLOWなら、CANに装着(NOTIFY_ATTACH)を示すメッセージをID:CAN_NOTIFYに送る。
 // * D2ピンが100ms未満でHIGHだったなら、CANに点滅要求(NOTIFY_BLINK)を示すメッセージをID:CAN_NOTIFYで送る。
+// * 碁石がタッチされてからDOUBLE_TOUCH_MS以内にもう一度タッチされたら、2回目はダブルタッチ(NOTIFY_DOUBLE_TOUCH)をID:CAN_NOTIFYで送る。
 // ----- 8< ----- 8< ----- 8< ----- 8< ----- 8< 
 
 #include <mcp_can.h>
@@ -37,6 +43,12 @@
 #define NOTIFY_ATTACH    0x1
 #define NOTIFY_DETACH    0x0
 #define NOTIFY_TOUCH     0x2
+#define NOTIFY_DOUBLE_TOUCH 0x4
+#define DOUBLE_TOUCH_MS  1200
+
+#define SET_STATE        0x1
+#define SET_BULK_STATE   0x5
+#define BULK_POINTS      10
 #define CAN_CS           D1
 #define CAN_INT          D0
 
@@ -50,8 +62,10 @@ bool can_interrupted = false;
 bool stone_touch_interrupted = false;
 bool stone_attach_interrupted = false;
 uint32_t touch_timer = 0;
+uint32_t last_touch = 0;  // 最後にタッチを通知した時刻（0はダブルタッチの待ちなし）
 uint32_t attach_timer = 0;
 bool stone_attached = false;
+uint32_t stone_direction = 90;  // 最後に受け取った碁石の向き（システムの北は90）
 
 HardwareSerial *uart;
 
@@ -124,20 +138,43 @@ void loop() {
   uint32_t canId;
   uint8_t len = 0;
   uint8_t canBuf[ 8];
-  uint8_t i2cBuf[ 3];
+  uint8_t i2cBuf[ 8];
   uint8_t res;
   
   if ( can_interrupted) {   // システムからのアクション・CANからメッセージが来たら
     can_interrupted = false;
-    res = CAN0.readMsgBuf( &canId, &len, canBuf);
-    uart->print( String( canId, HEX));
-    for ( uint32_t i = 0; i < len; i++) {
-      i2cBuf[ i] = canBuf[ i];
-      uart->print( ", " + String( canBuf[ i], HEX));
+    // 2つの受信バッファの両方にフレームが入るとINTがLOWのままになり、次の割り込みが来ないので、全て読み出す
+    while ( CAN0.checkReceive() == CAN_MSGAVAIL) {
+      res = CAN0.readMsgBuf( &canId, &len, canBuf);
+      uart->print( String( canId, HEX));
+      for ( uint32_t i = 0; i < len; i++) {
+        i2cBuf[ i] = canBuf[ i];
+        uart->print( ", " + String( canBuf[ i], HEX));
+      }
+      uart->println();
+
+      if ( canId == CAN_BLINK && len == 8 && canBuf[ 0] == SET_BULK_STATE) {
+        // まとめて送られた状態から、自分の交点の状態だけを取り出す
+        uint8_t column = ( UNIQID & 0x0F) - 1;
+        if ( canBuf[ 1] == ( UNIQID >> 4) && ( canBuf[ 2] & 0x0F) == column / BULK_POINTS) {
+          uint8_t k = column % BULK_POINTS;
+          uint8_t state = ( canBuf[ 3 + k / 2] >> ( ( k & 1) * 4)) & 0x0F;
+          if ( stone_attached && ( state & 0x03) != 0) {
+            i2cBuf[ 0] = SET_STATE;
+            i2cBuf[ 1] = state & 0x03;
+            i2cBuf[ 2] = state >> 2;
+            i2cBuf[ 3] = stone_direction >> 8;
+            i2cBuf[ 4] = stone_direction & 0xFF;
+            i2cSend( STONE_I2C_ADDR, i2cBuf, 5);
+          }
+        }
+      } else {
+        if ( canId == CAN_ORDER && len >= 5 && canBuf[ 0] == SET_STATE) {
+          stone_direction = (uint32_t)canBuf[ 3] * 256 + canBuf[ 4];
+        }
+        i2cSend( STONE_I2C_ADDR, i2cBuf, len);
+      }
     }
-    uart->println();
-
-    i2cSend( STONE_I2C_ADDR, i2cBuf, len);
   }
 
   // 碁石が装着・脱着されたら
@@ -166,9 +203,17 @@ void loop() {
   if ( stone_touch_interrupted) {
     stone_touch_interrupted = false;
     if ( stone_attached) {
-      canBuf[ 0] = NOTIFY_TOUCH;
-      res = CAN0.sendMsgBuf( CAN_NOTIFY, 0, 1, canBuf);
-      uart->println( "Touch");
+      if ( last_touch != 0 && millis() - last_touch < DOUBLE_TOUCH_MS) {
+        last_touch = 0;
+        canBuf[ 0] = NOTIFY_DOUBLE_TOUCH;
+        res = CAN0.sendMsgBuf( CAN_NOTIFY, 0, 1, canBuf);
+        uart->println( "Double touch");
+      } else {
+        last_touch = millis();
+        canBuf[ 0] = NOTIFY_TOUCH;
+        res = CAN0.sendMsgBuf( CAN_NOTIFY, 0, 1, canBuf);
+        uart->println( "Touch");
+      }
     }
   }  
 
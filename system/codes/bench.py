@@ -0,0 +1,177 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+
+import can
+
+from emogo import Emogo
+
+# 仮想 CAN バス上で Emogo を動かし、性能を測定するベンチマーク
+# 使い方: python3 bench.py --size 9 --moves 80 --games 3 --taps 10 --output result.json
+
+class Benchmark:
+    def __init__(self, size, channel='emogo-bench', quiet_time=0.02, buses=1, debounce=0.05):
+        self.size = size
+        self.quiet_time = quiet_time  # この時間フレームが届かなければ送信が終わったとみなす（秒）
+        channels = [f'{channel}-{bus}' for bus in range(buses)]
+        self.emogo = Emogo(size, size, channel=channels, bustype='virtual', use_keyboard=False, debounce=debounce)
+        self.addressing = self.emogo.can_interface.addressing
+        # 碁盤側（石）として振る舞うバス
+        self.stones_buses = [can.interface.Bus(channel=name, interface='virtual') for name in channels]
+        self.processed = threading.Event()
+        self.rules_cpu_times = []
+
+        # 受信した入力の処理が終わったことを知るためのフック（チャタリング除去の待ち時間の後に呼ばれる）
+        handle_input_batch = self.emogo.handle_input_batch
+        def hooked_handle_input_batch(events):
+            try:
+                handle_input_batch(events)
+            finally:
+                self.processed.set()
+        self.emogo.handle_input_batch = hooked_handle_input_batch
+
+        # 死に石判定（ルールの評価）にかかった CPU 時間を測るフック
+        board = self.emogo.board
+        check = board.check_dead_stones_after_placement
+        def timed_check(x, y, color):
+            start = time.thread_time()
+            try:
+                check(x, y, color)
+            finally:
+                self.rules_cpu_times.append(time.thread_time() - start)
+        board.check_dead_stones_after_placement = timed_check
+
+    # 石からのフレームを送り、処理が終わって送信が止まるまでに届いたフレームを返すメソッド
+    def send_event(self, x, y, action):
+        self.processed.clear()
+        start = time.time()
+        bus, can_id = self.addressing.event_id(x, y)
+        self.stones_buses[bus].send(can.Message(arbitration_id=can_id, data=[action], is_extended_id=can_id > 0x7FF))
+        self.processed.wait()
+        while self.emogo.can_interface.get_tx_stats()['queue_depth']:
+            time.sleep(0.0005)
+        frames = []
+        for stones_bus in self.stones_buses:
+            while True:
+                message = stones_bus.recv(timeout=self.quiet_time)
+                if message is None:
+                    break
+                frames.append(message)
+        frames.sort(key=lambda frame: frame.timestamp)
+        return start, frames
+
+    # 1局分の着手を送り、1手ごとの遅延とフレーム数を測定するメソッド
+    def play_game(self, moves, rnd, results):
+        board = self.emogo.board
+        for _ in range(moves):
+            empties = [(x, y) for x in range(1, self.size + 1) for y in range(1, self.size + 1)
+                       if board.get_stone(x, y) is None]
+            if not empties or self.emogo.game_over:
+                break
+            x, y = rnd.choice(empties)
+            start, frames = self.send_event(x, y, 1)
+            if (x, y) in self.emogo.illegal_stones:
+                # コウで拒否された石は取り除く
+                self.send_event(x, y, 0)
+                continue
+            results['frames_per_move'].append(len(frames))
+            if frames:
+                results['move_latency'].append(frames[-1].timestamp - start)
+            # 死に石を取り除く
+            for dead_x, dead_y in list(self.emogo.dead_stones_list):
+                self.send_event(dead_x, dead_y, 0)
+
+    # 連をタップしてから、ハイライトのフレームが全て届くまでの遅延を測定するメソッド
+    def tap_groups(self, taps, rnd, results):
+        board = self.emogo.board
+        chains = []
+        for p in board.stone_points():
+            chain = board.chains[p]
+            if chain not in chains:
+                chains.append(chain)
+        rnd.shuffle(chains)
+        for chain in chains[:taps]:
+            x, y = board.to_position(next(iter(chain.stones)))
+            start, frames = self.send_event(x, y, 2)
+            highlights = [frame for frame in frames if frame.data[0] == 0x02 and frame.data[1] == 0xFF]
+            if highlights:
+                results['tap_latency'].append(highlights[-1].timestamp - start)
+
+    # Emogo のスレッドを止めて送信キューを送り終えてから、バスを閉じるメソッド
+    def shutdown(self):
+        self.emogo.shutdown()
+        for stones_bus in self.stones_buses:
+            stones_bus.shutdown()
+
+# 値のリストを集計するメソッド（単位はミリ秒に変換する）
+def summarize(values, scale=1000.0):
+    if not values:
+        return None
+    values = sorted(value * scale for value in values)
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values),
+        'p50': values[len(values) // 2],
+        'p99': values[min(len(values) - 1, int(len(values) * 0.99))],
+        'max': values[-1]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Emogo on a virtual CAN bus")
+    parser.add_argument('--size', type=int, default=9, help="board size (1-19)")
+    parser.add_argument('--buses', type=int, default=1, help="number of virtual buses to split the board across")
+    parser.add_argument('--moves', type=int, default=60, help="moves per game")
+    parser.add_argument('--games', type=int, default=3, help="number of games")
+    parser.add_argument('--taps', type=int, default=10, help="groups to tap after each game")
+    parser.add_argument('--debounce', type=float, default=0.05,
+                        help="seconds Emogo waits for a stone sensor to settle (included in the latencies)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the JSON result to this file instead of stdout")
+    args = parser.parse_args()
+    if not 1 <= args.size <= 19:
+        parser.error("board size must be between 1 and 19")
+
+    rnd = random.Random(args.seed)
+    results = {'move_latency': [], 'frames_per_move': [], 'tap_latency': []}
+    rules_cpu_times = []
+    # Emogo の表示は測定の邪魔になるので捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        for game in range(args.games):
+            benchmark = Benchmark(args.size, channel=f'emogo-bench-{game}', buses=args.buses, debounce=args.debounce)
+            try:
+                benchmark.play_game(args.moves, rnd, results)
+                benchmark.tap_groups(args.taps, rnd, results)
+            finally:
+                benchmark.shutdown()
+            rules_cpu_times.extend(benchmark.rules_cpu_times)
+
+    report = {
+        'board_size': args.size,
+        'buses': args.buses,
+        'debounce_s': args.debounce,
+        'games': args.games,
+        'moves_per_game': args.moves,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'python_can': can.__version__,
+        'move_latency_ms': summarize(results['move_latency']),
+        'frames_per_move': summarize(results['frames_per_move'], scale=1),
+        'rules_cpu_ms': summarize(rules_cpu_times),
+        'tap_latency_ms': summarize(results['tap_latency'])
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
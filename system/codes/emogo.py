@@ -1,394 +1,650 @@
+import collections
+import heapq
+import logging
 import threading
 import time
-import can
 import sys
 
-class Stone:
-    # 定数の定義
-    COLOR_VALUES = {
-        'black': 0x01,
-        'white': 0x02
-    }
-
-    DIRECTION_VALUES = {
-        'north': 90,
-        'east': 180,
-        'south': 270,
-        'west': 0
-    }
-
-    EMOTION_VALUES = {
-        'dead': 0,
-        'defensive': 1,
-        'normal': 2,
-        'offensive': 3
-    }
-
-    def __init__(self):
-        self.color = None
-        self.direction = self.DIRECTION_VALUES['north']
-        self.emotion = self.EMOTION_VALUES['normal']
-
-    # 色を設定するメソッド
-    def set_color(self, color):
-        if color in self.COLOR_VALUES:
-            self.color = self.COLOR_VALUES[color]
-        elif color in self.COLOR_VALUES.values():
-            self.color = color
-        else:
-            raise ValueError("Invalid color")
-
-    # 色を取得するメソッド
-    def get_color(self):
-        return self.color or 0x00  # 0x00 は石がないことを示す
-
-    # 向きを設定するメソッド
-    def set_direction(self, direction):
-        if direction in self.DIRECTION_VALUES:
-            self.direction = self.DIRECTION_VALUES[direction]
-        elif direction in self.DIRECTION_VALUES.values():
-            self.direction = direction
-        else:
-            raise ValueError("Invalid direction")
-
-    # 向きを取得するメソッド
-    def get_direction(self):
-        return self.direction or 0
-
-    # 感情を設定するメソッド
-    def set_emotion(self, emotion):
-        if emotion in self.EMOTION_VALUES:
-            self.emotion = self.EMOTION_VALUES[emotion]
-        elif emotion in self.EMOTION_VALUES.values():
-            self.emotion = emotion
-        else:
-            raise ValueError("Invalid emotion")
-
-    # 感情を取得するメソッド
-    def get_emotion(self):
-        return self.emotion or self.EMOTION_VALUES['dead']
-
-class Board:
-    def __init__(self, n, m):
-        self.n = n  # 行数
-        self.m = m  # 列数
-        self.board = [[None for _ in range(m)] for _ in range(n)]  # [行][列] の順序
-        self.connect = []
-
-    # 石を置くメソッド
-    def place_stone(self, x, y, color):
-        if 1 <= x <= self.n and 1 <= y <= self.m:
-            ix = x - 1  # 行インデックス
-            iy = y - 1  # 列インデックス
-            if self.board[ix][iy] is None:
-                stone = Stone()
-                stone.set_color(color)
-                stone.set_direction('north')
-                stone.set_emotion('normal')
-                self.board[ix][iy] = stone
-                # ここで死に石判定を行う
-                self.check_dead_stones_after_placement(x, y, color)
-            else:
-                raise RuntimeError(f"Position ({x}, {y}) already has a stone")
-        else:
-            raise IndexError(f"Position ({x}, {y}) is out of bounds")
+from emogo_log import FrameRing, Lazy, board_logger, format_frame, frame_logger, logger, setup_logging
+from emogo_metrics import Metrics
+from emogo_rules import Board, BoardChange, Chain, Stone, StoneView  # emogo から読み込むコードのために公開する
+from emogo_score import Scorer
 
-    # 石を取り除くメソッド
-    def remove_stone(self, x, y):
-        if 1 <= x <= self.n and 1 <= y <= self.m:
-            ix = x - 1  # 行インデックス
-            iy = y - 1  # 列インデックス
-            if self.board[ix][iy] is not None:
-                self.board[ix][iy] = None
-            else:
-                raise RuntimeError(f"No stone at position ({x}, {y}) to remove")
-        else:
-            raise IndexError(f"Position ({x}, {y}) is out of bounds")
+# python-can と asyncio は使うときに読み込む（ルールだけを使う場合や、スレッドで動かす場合は読み込まない）
 
-    # 石を取得するメソッド
-    def get_stone(self, x, y):
-        if 1 <= x <= self.n and 1 <= y <= self.m:
-            ix = x - 1  # 行インデックス
-            iy = y - 1  # 列インデックス
-            return self.board[ix][iy]
-        else:
-            raise IndexError(f"Position ({x}, {y}) is out of bounds")
+class Addressing:
+    # 碁盤の座標と (バス番号, CAN ID) を対応付けるクラス
+    # 碁盤の行をバスの数で分け、各バスには連続した行を割り当てる（例: 19路盤を2本のバスに分けると 10行 + 9行）
+    # CAN ID の形式（x' はバス内での行番号（1始まり）、y は列番号、i = (x' - 1) * m + (y - 1)）:
+    #   'nibble':   石から 0x600 | x' << 4 | y、石へ 0x400 | x' << 4 | y（標準 ID、バスあたり 15x15 まで）
+    #   'index':    石から 0x600 | i、石へ 0x400 | i（標準 ID、バスあたり 256 交点まで）
+    #   'extended': 石から 0x6000000 | x << 8 | y、石へ 0x4000000 | x << 8 | y（拡張 ID、x と y は盤全体での番号）
+    #               碁盤のマイコン（board.ino）は標準 ID しか受信しないので、今は仮想バス（virtual）でしか使えない
+    # ブロードキャスト（0x1FF）は全てのバスに送信する。碁盤からの命令は 0x700 で届く
+    # table を指定すると（'extended' のみ）、1本のバスを複数の碁盤で共有できるように CAN ID に碁盤の番号を入れる:
+    #   石から 0x6000000 | table << 16 | x << 8 | y、石へ 0x4000000 | table << 16 | x << 8 | y、
+    #   ブロードキャスト 0x1FF0000 | table、命令 0x7000000 | table << 16
+    SCHEMES = ('nibble', 'index', 'extended')
+    STANDARD_SCHEMES = ('nibble', 'index')  # 碁盤のマイコンが受信できる形式
+    BROADCAST_ID = 0x1FF
+    CONTROL_ID = 0x700
 
-    # 死に石判定を行うメソッド
-    def check_dead_stones_after_placement(self, x, y, color):
-        opponent_color = 'white' if color == 'black' else 'black'
-
-        # 1. 相手の死に石を判定し、感情を 'dead' に設定
-        opponent_dead_stones = self.find_dead_stones(opponent_color)
-        for ix, iy in opponent_dead_stones:
-            stone = self.board[ix][iy]
-            if stone:
-                stone.set_emotion('dead')
-
-        # 2. 自分の死に石を判定し、感情を 'dead' に設定
-        self_dead_stones = self.find_dead_stones(color)
-        for ix, iy in self_dead_stones:
-            stone = self.board[ix][iy]
-            if stone:
-                stone.set_emotion('dead')
-
-        # 3. 繋がりと感情の更新
-        self.check_connect()
-
-    # 死に石を見つけるメソッド
-    def find_dead_stones(self, color):
-        visited = [[False for _ in range(self.m)] for _ in range(self.n)]
-        dead_stones = []
+    def __init__(self, n, m, buses=1, scheme=None, table=None):
+        if buses < 1 or buses > n:
+            raise ValueError("Invalid number of buses")
+        if table is not None and scheme != 'extended':
+            raise ValueError("Only the 'extended' addressing scheme can carry a table number")
+        if table is not None and not 0 <= table <= 0xFF:
+            raise ValueError(f"Table number {table} is out of range")
+        self.n = n
+        self.m = m
+        self.buses = buses
+        self.rows_per_bus = -(-n // buses)
+        if scheme is None:
+            # 標準 ID に収まる形式を優先する（拡張 ID はフレームが長くなる）
+            scheme = next(scheme for scheme in self.SCHEMES if self.fits(scheme))
+        if scheme not in self.SCHEMES:
+            raise ValueError("Invalid addressing scheme")
+        if not self.fits(scheme):
+            raise ValueError(f"A {n}x{m} board on {buses} bus(es) does not fit the '{scheme}' addressing scheme")
+        self.scheme = scheme
+        self.table = table
+        if table is None:
+            self.broadcast_id = self.BROADCAST_ID
+            self.control_id = self.CONTROL_ID
+        else:
+            self.broadcast_id = self.BROADCAST_ID << 16 | table
+            self.control_id = self.CONTROL_ID << 16 | table << 16
+        # 変換表は最初に1度だけ作る
+        self.bus_rows = [[] for _ in range(buses)]  # バスごとの (CAN ID での行番号, x) のリスト
+        self.stone_ids = {}  # (x, y) -> (バス番号, 石へ送る CAN ID)
+        self.event_ids = {}  # (x, y) -> (バス番号, 石から届く CAN ID)
+        self.positions = {}  # (バス番号, 石から届く CAN ID) -> (x, y)
+        for x in range(1, n + 1):
+            bus, local_x = divmod(x - 1, self.rows_per_bus)
+            local_x += 1
+            self.bus_rows[bus].append((x if scheme == 'extended' else local_x, x))
+            for y in range(1, m + 1):
+                if scheme == 'nibble':
+                    code = local_x << 4 | y
+                    stone_id, event_id = 0x400 | code, 0x600 | code
+                elif scheme == 'index':
+                    code = (local_x - 1) * m + (y - 1)
+                    stone_id, event_id = 0x400 | code, 0x600 | code
+                else:
+                    code = (table or 0) << 16 | x << 8 | y
+                    stone_id, event_id = 0x400 << 16 | code, 0x600 << 16 | code
+                self.stone_ids[(x, y)] = (bus, stone_id)
+                self.event_ids[(x, y)] = (bus, event_id)
+                self.positions[(bus, event_id)] = (x, y)
 
-        for ix in range(self.n):
-            for iy in range(self.m):
-                if visited[ix][iy]:
-                    continue
-                stone = self.board[ix][iy]
-                if stone is None or stone.get_color() != Stone.COLOR_VALUES[color]:
-                    continue
-                group, liberties = self.dfs(ix, iy, color, visited)
-                if liberties == 0:
-                    dead_stones.extend(group)
-        return dead_stones
+    # 指定した形式で全ての交点を表せるか判定するメソッド
+    def fits(self, scheme):
+        if scheme == 'nibble':
+            return self.rows_per_bus <= 15 and self.m <= 15
+        if scheme == 'index':
+            return self.rows_per_bus * self.m <= 256
+        return self.n <= 255 and self.m <= 255
 
-    # 深さ優先探索でグループと呼吸点を計算
-    def dfs(self, ix, iy, color, visited):
-        stack = [(ix, iy)]
-        group = []
-        liberties = set()  # 呼吸点をセットで管理
-        visited[ix][iy] = True
-
-        while stack:
-            x, y = stack.pop()
-            group.append((x, y))
-
-            neighbors = [
-                (x - 1, y),  # 上
-                (x + 1, y),  # 下
-                (x, y - 1),  # 左
-                (x, y + 1)   # 右
-            ]
-
-            for nx, ny in neighbors:
-                if 0 <= nx < self.n and 0 <= ny < self.m:
-                    neighbor_stone = self.board[nx][ny]
-                    if neighbor_stone is None or neighbor_stone.get_emotion() == Stone.EMOTION_VALUES['dead']:
-                        liberties.add((nx, ny))  # 呼吸点をセットに追加
-                    elif neighbor_stone.get_color() == Stone.COLOR_VALUES[color] and not visited[nx][ny]:
-                        visited[nx][ny] = True
-                        stack.append((nx, ny))
-        return group, len(liberties)
-
-    # 連のためのDFS（死に石も含む）
-    def dfs_for_connect(self, ix, iy, color, visited):
-        stack = [(ix, iy)]
-        group = []
-        liberties = set()
-        visited[ix][iy] = True
-
-        while stack:
-            x, y = stack.pop()
-            group.append((x, y))
-
-            neighbors = [
-                (x - 1, y),  # 上
-                (x + 1, y),  # 下
-                (x, y - 1),  # 左
-                (x, y + 1)   # 右
-            ]
-
-            for nx, ny in neighbors:
-                if 0 <= nx < self.n and 0 <= ny < self.m:
-                    if not visited[nx][ny]:
-                        neighbor_stone = self.board[nx][ny]
-                        if neighbor_stone is not None and neighbor_stone.get_color() == color:
-                            visited[nx][ny] = True
-                            stack.append((nx, ny))
-                        elif neighbor_stone is None or neighbor_stone.get_emotion() == Stone.EMOTION_VALUES['dead']:
-                            liberties.add((nx, ny))
-        return group, len(liberties)
-
-    # 連と感情を再計算するメソッド
-    def check_connect(self):
-        self.connect = []
-        visited = [[False for _ in range(self.m)] for _ in range(self.n)]
-
-        for ix in range(self.n):
-            for iy in range(self.m):
-                if visited[ix][iy]:
-                    continue
-                stone = self.board[ix][iy]
-                if stone is None:
-                    continue  # 死に石も含めるため、感情チェックを削除
-                color = stone.get_color()
-                group, liberties_count = self.dfs_for_connect(ix, iy, color, visited)
-                # 感情の設定
-                emotion = 'normal'
-                if liberties_count == 1:
-                    emotion = 'defensive'
-                elif liberties_count == 0:
-                    emotion = 'dead'
-                for gx, gy in group:
-                    self.board[gx][gy].set_emotion(emotion)
-                self.connect.append(group)
-
-    # 指定された位置の石と連絡している石を取得するメソッド
-    def get_connect(self, x, y):
-        if 1 <= x <= self.n and 1 <= y <= self.m:
-            ix = x - 1  # 行インデックス
-            iy = y - 1  # 列インデックス
-            start_stone = self.board[ix][iy]
-            if start_stone is None:
-                raise RuntimeError(f"No stone at position ({x}, {y})")
-            else:
-                color = start_stone.get_color()
-                connected_stones = self.dfs_get_connected_stones(ix, iy, color)
-                return [(cx + 1, cy + 1) for cx, cy in connected_stones]
-        else:
+    # 石へ送るフレームの (バス番号, CAN ID) を取得するメソッド
+    def stone_id(self, x, y):
+        address = self.stone_ids.get((x, y))
+        if address is None:
             raise IndexError(f"Position ({x}, {y}) is out of bounds")
+        return address
 
-    # 深さ優先探索で連絡している石を取得するメソッド（死に石も含む）
-    def dfs_get_connected_stones(self, ix, iy, color):
-        stack = [(ix, iy)]
-        connected = []
-        visited = [[False for _ in range(self.m)] for _ in range(self.n)]
-        visited[ix][iy] = True
-
-        while stack:
-            x, y = stack.pop()
-            connected.append((x, y))
-
-            neighbors = [
-                (x - 1, y),  # 上
-                (x + 1, y),  # 下
-                (x, y - 1),  # 左
-                (x, y + 1)   # 右
-            ]
-
-            for nx, ny in neighbors:
-                if 0 <= nx < self.n and 0 <= ny < self.m:
-                    if not visited[nx][ny]:
-                        neighbor_stone = self.board[nx][ny]
-                        if neighbor_stone is not None and neighbor_stone.get_color() == color:
-                            visited[nx][ny] = True
-                            stack.append((nx, ny))
-        return connected
-
-    # 石の数を数えるメソッド
-    def stone_counts(self):
-        black_count = 0
-        white_count = 0
-        for row in self.board:
-            for stone in row:
-                if stone and stone.get_emotion() != Stone.EMOTION_VALUES['dead']:
-                    if stone.get_color() == Stone.COLOR_VALUES['black']:
-                        black_count += 1
-                    elif stone.get_color() == Stone.COLOR_VALUES['white']:
-                        white_count += 1
-        return {'black': black_count, 'white': white_count}
-
-    # ボードの状態を取得するメソッド
-    def get_board_state(self):
-        state = []
-        for ix, row in enumerate(self.board):
-            for iy, stone in enumerate(row):
-                if stone:
-                    x = ix + 1
-                    y = iy + 1
-                    state.append({
-                        'x': x,
-                        'y': y,
-                        'color': stone.get_color(),
-                        'emotion': stone.get_emotion(),
-                        'direction': stone.get_direction()
-                    })
-        return state
-
-    # 指定した碁石の状態（感情、向き）を直接変更するメソッド
-    def set_stone_state(self, x, y, emotion=None, direction=None):
-        if 1 <= x <= self.n and 1 <= y <= self.m:
-            ix = x - 1  # 行インデックス
-            iy = y - 1  # 列インデックス
-            stone = self.board[ix][iy]
-            if stone is not None:
-                if emotion is not None:
-                    stone.set_emotion(emotion)
-                if direction is not None:
-                    stone.set_direction(direction)
-            else:
-                raise RuntimeError(f"No stone at position ({x}, {y}) to set state")
-        else:
+    # 石から届くフレームの (バス番号, CAN ID) を取得するメソッド（テストやベンチマーク用）
+    def event_id(self, x, y):
+        address = self.event_ids.get((x, y))
+        if address is None:
             raise IndexError(f"Position ({x}, {y}) is out of bounds")
+        return address
+
+    # 石から届いたフレームの位置 (x, y) を取得するメソッド（石からのフレームでなければ None）
+    def position(self, bus, can_id):
+        return self.positions.get((bus, can_id))
 
 class CANInterface:
-    def __init__(self, channel='can0', bustype='socketcan'):
+    # 送信の優先度（値が小さいほど先に送信する）
+    PRIORITY_STATE = 0      # 石の状態の更新
+    PRIORITY_HIGHLIGHT = 1  # 連のハイライト
+    PRIORITY_BLINK = 2      # 点滅のブロードキャスト
+
+    # 碁盤（操作パネル）からの命令（Addressing.control_id で、どのバスからでもよい）
+    CONTROL_UNDO = 0x01  # 1手戻す
+    CONTROL_REDO = 0x02  # 戻した手をやり直す
+    RX_POLL_INTERVAL = 0.2  # 受信スレッドが終了の指示を確認する間隔（秒）
+
+    # channel にはチャンネル名、または複数のバスを使う場合はそのリストを指定する
+    # バスごとに受信・送信のスレッド（asyncio モードではコルーチン）を動かす
+    def __init__(self, channel='can0', bustype='socketcan', tx_queue_size=256, threaded=True, metrics=None,
+                 addressing=None):
         self.emogo = None
-        self.bus = can.interface.Bus(channel=channel, bustype=bustype)
-        self.receive_thread = threading.Thread(target=self.receive_messages)
-        self.receive_thread.daemon = True  # Daemon thread
-        self.receive_thread.start()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.recent_frames = FrameRing()  # 直近に送受信したフレーム
+        self.recorder = None  # 送受信したフレームを記録する FrameRecorder
+        self.channels = [channel] if isinstance(channel, str) else list(channel)
+        self.addressing = addressing if addressing is not None else Addressing(15, 15)
+        if self.addressing.buses != len(self.channels):
+            raise ValueError("The addressing does not match the number of buses")
+        if self.addressing.scheme not in self.addressing.STANDARD_SCHEMES and bustype != 'virtual':
+            raise ValueError(f"The board firmware only receives standard CAN IDs, so the "
+                             f"'{self.addressing.scheme}' addressing scheme can only be used on virtual buses")
+        import can
+        self.can = can
+        self.buses = [can.interface.Bus(channel=name, interface=bustype) for name in self.channels]
+        self.bus = self.buses[0]
+        # 送信キュー: 同じバス・同じ CAN ID・同じ命令（・同じ slot）のフレームは新しいデータで上書きする
+        self.tx_queue_size = tx_queue_size  # 全てのバスの合計
+        self.tx_condition = threading.Condition()
+        self.tx_heaps = [[] for _ in self.buses]  # バスごとの (優先度, 順番, キー)
+        self.tx_pending = {}  # キー (バス番号, CAN ID, 命令, slot) -> (優先度, 順番, データ)
+        self.tx_sequence = 0
+        self.tx_stats = {'sent': 0, 'coalesced': 0, 'dropped': 0, 'blocked': 0, 'errors': 0}
+        self.tx_events = None  # asyncio モードで送信コルーチンを起こすイベント（バスごと）
+        self.closed = False  # shutdown で True にし、受信・送信のスレッドを終了させる
+        self.threads = []
+        self.metrics.add_gauge('tx', self.get_tx_stats)
+        if threaded:
+            for bus in range(len(self.buses)):
+                for target in (self.transmit_messages, self.receive_messages):
+                    thread = threading.Thread(target=target, args=(bus,))
+                    thread.daemon = True  # Daemon thread
+                    thread.start()
+                    self.threads.append(thread)
 
     # CANメッセージを受信するメソッド
-    def receive_messages(self):
-        while True:
-            message = self.bus.recv()
+    def receive_messages(self, bus=0):
+        while not self.closed:
+            message = self.buses[bus].recv(self.RX_POLL_INTERVAL)
             if message is not None:
-                can_id = message.arbitration_id
-                data = message.data
-                self.process_message(can_id, data)
+                self.handle_message(message, bus)
+
+    # CANメッセージを受信するコルーチン（asyncio モード）
+    async def receive_messages_async(self, bus=0):
+        import asyncio
+        reader = self.can.AsyncBufferedReader()
+        notifier = self.can.Notifier(self.buses[bus], [reader], loop=asyncio.get_running_loop())
+        try:
+            while True:
+                message = await reader.get_message()
+                self.handle_message(message, bus)
+        finally:
+            notifier.stop()
+
+    # 受信したメッセージを処理し、処理時間を記録するメソッド
+    def handle_message(self, message, bus=0):
+        start = time.perf_counter_ns()
+        self.metrics.count('frames_in')
+        self.recent_frames.record('RX', message.arbitration_id, message.data)
+        if self.recorder is not None:
+            self.recorder.record('RX', message.arbitration_id, message.data, bus)
+        if frame_logger.isEnabledFor(logging.DEBUG):
+            frame_logger.debug("RX %s", Lazy(format_frame, message.arbitration_id, bytes(message.data)))
+        self.process_message(message.arbitration_id, message.data, bus)
+        self.metrics.observe('rx.process_message', start)
 
     # メッセージを処理するメソッド
-    def process_message(self, can_id, data):
+    def process_message(self, can_id, data, bus=0):
+        if can_id == self.addressing.control_id:
+            command = data[0]
+            # 盤面はタイマーのスレッドでも変わるので、同じロックの中で処理する
+            with self.emogo.animations.condition:
+                if command == self.CONTROL_UNDO:
+                    self.emogo.undo()
+                elif command == self.CONTROL_REDO:
+                    self.emogo.redo()
+                else:
+                    logger.warning("Unknown control command: %d", command)
+            return
         # CAN ID から石の位置を取得
-        if (can_id & 0xF00) == 0x600:
-            x = (can_id & 0x0F0) >> 4
-            y = can_id & 0x00F
+        position = self.addressing.position(bus, can_id)
+        if position is not None:
+            x, y = position
             # データの解釈
             action = data[0]
-            if action == 0:  # 取り除かれた
-                self.emogo.handle_stone_removed(x, y)
-            elif action == 1:  # 置かれた
-                self.emogo.handle_stone_placed(x, y)
-            elif action == 2:  # タップされた
-                self.emogo.handle_stone_tapped(x, y)
+            if action in (InputStage.REMOVED, InputStage.PLACED, InputStage.TAPPED):
+                # 取り除かれた・置かれた・タップされた（チャタリングが落ち着いてから処理する）
+                self.emogo.inputs.submit(x, y, action)
+            elif action == 3:  # 再起動した（全体の再送信を要求）
+                with self.emogo.animations.condition:
+                    self.emogo.handle_resync_request(x, y)
+            elif action == 4:  # ダブルタップされた（ヒントを要求、探している間も受信は止めない）
+                self.emogo.request_hint(x, y)
             else:
-                print(f"Unknown action: {action}")
+                logger.warning("Unknown action: %d", action)
         else:
-            print(f"Unknown CAN ID: 0x{can_id:X}")
+            logger.warning("Unknown CAN ID: 0x%X", can_id)
 
-    # メッセージを送信するメソッド
-    def send_message(self, can_id, data):
-        message = can.Message(arbitration_id=can_id, data=data, is_extended_id=False)
+    # メッセージを送信キューに入れるメソッド（送信は送信スレッドで行う）
+    # slot を指定すると、同じ CAN ID・同じ命令でも slot が違うフレームは別のフレームとして扱う（上書きしない）
+    def send_message(self, can_id, data, priority=PRIORITY_STATE, bus=0, slot=None):
+        key = (bus, can_id, data[0] if data else None, slot)
+        with self.tx_condition:
+            pending = self.tx_pending.get(key)
+            if pending is not None and pending[0] <= priority:
+                # まだ送信していない同じフレームを新しいデータで置き換える
+                self.tx_pending[key] = (pending[0], pending[1], data)
+                self.tx_stats['coalesced'] += 1
+                return
+            if pending is not None:
+                self.tx_stats['coalesced'] += 1
+            elif len(self.tx_pending) >= self.tx_queue_size and not self.evict_message(priority):
+                if priority != self.PRIORITY_STATE:
+                    self.tx_stats['dropped'] += 1
+                    return
+                # 状態の更新は捨てずに、キューが空くまで待つ
+                # （asyncio モードでは送信コルーチンが同じループで動くので、待たずにキューに入れる）
+                self.tx_stats['blocked'] += 1
+                while (self.tx_events is None and not self.closed and len(self.tx_pending) >= self.tx_queue_size
+                       and not self.evict_message(priority)):
+                    self.tx_condition.wait()
+            self.tx_sequence += 1
+            self.tx_pending[key] = (priority, self.tx_sequence, data)
+            heapq.heappush(self.tx_heaps[bus], (priority, self.tx_sequence, key))
+            self.tx_condition.notify_all()
+        if self.tx_events is not None:
+            self.tx_events[bus].set()
+
+    # 全てのバスにメッセージを送信するメソッド（ブロードキャスト）
+    def broadcast_message(self, can_id, data, priority=PRIORITY_STATE):
+        for bus in range(len(self.buses)):
+            self.send_message(can_id, data, priority, bus)
+
+    # キューが一杯のとき、指定した優先度より低いフレームを1つ捨てるメソッド
+    def evict_message(self, priority):
+        victim = None
+        for key, (pending_priority, sequence, _) in self.tx_pending.items():
+            if pending_priority > priority and (victim is None or (pending_priority, sequence) > victim[0]):
+                victim = ((pending_priority, sequence), key)
+        if victim is None:
+            return False
+        del self.tx_pending[victim[1]]
+        self.tx_stats['dropped'] += 1
+        return True
+
+    # 指定したバスの送信キューから次に送信するフレーム (CAN ID, データ) を取り出すメソッド
+    # block が False でキューが空の場合、または shutdown の後は None を返す
+    def pop_message(self, block=True, bus=0):
+        heap = self.tx_heaps[bus]
+        with self.tx_condition:
+            while True:
+                while not heap or self.closed:
+                    if not block or self.closed:
+                        return None
+                    self.tx_condition.wait()
+                priority, sequence, key = heapq.heappop(heap)
+                pending = self.tx_pending.get(key)
+                # 置き換えや破棄で古くなったエントリは読み飛ばす
+                if pending is not None and pending[1] == sequence:
+                    del self.tx_pending[key]
+                    self.tx_condition.notify_all()
+                    return key[1], pending[2]
+
+    # フレームをバスに送信するメソッド
+    def transmit(self, can_id, data, bus=0):
+        start = time.perf_counter_ns()
+        message = self.can.Message(arbitration_id=can_id, data=data, is_extended_id=can_id > 0x7FF)
         try:
-            self.bus.send(message)
-            # メッセージ内容を表示します
-            data_bytes = ' '.join(f"{byte:02X}" for byte in data)
-            print(f"{can_id:03X}#{data_bytes}")
-        except can.CanError as e:
-            print(f"Error sending CAN message: {e}")
+            self.buses[bus].send(message)
+            self.metrics.observe('tx.send', start)
+            self.tx_stats['sent'] += 1
+            self.recent_frames.record('TX', can_id, data)
+            if self.recorder is not None:
+                self.recorder.record('TX', can_id, data, bus)
+            # メッセージ内容の表示はログが有効なときだけ作成する
+            if frame_logger.isEnabledFor(logging.DEBUG):
+                frame_logger.debug("TX %s", Lazy(format_frame, can_id, bytes(data)))
+        except self.can.CanError as e:
+            self.tx_stats['errors'] += 1
+            logger.error("Error sending CAN message: %s", e)
+
+    # 送信キューからフレームを取り出して送信するメソッド（送信スレッド）
+    def transmit_messages(self, bus=0):
+        while True:
+            frame = self.pop_message(bus=bus)
+            if frame is None:
+                return
+            self.transmit(*frame, bus)
+
+    # 送信キューからフレームを取り出して送信するコルーチン（asyncio モード）
+    async def transmit_messages_async(self, bus=0):
+        import asyncio
+        if self.tx_events is None:
+            self.tx_events = [asyncio.Event() for _ in self.buses]
+        event = self.tx_events[bus]
+        while True:
+            frame = self.pop_message(block=False, bus=bus)
+            if frame is None:
+                event.clear()
+                await event.wait()
+                continue
+            self.transmit(*frame, bus)
+            await asyncio.sleep(0)  # 受信処理に順番を譲る
+
+    # 送信の統計情報を取得するメソッド
+    def get_tx_stats(self):
+        with self.tx_condition:
+            stats = dict(self.tx_stats)
+            stats['queue_depth'] = len(self.tx_pending)
+        return stats
+
+    # 送信キューに残ったフレームを送り終えてから（timeout 秒まで）、受信・送信のスレッドを止めて全てのバスを閉じるメソッド
+    def shutdown(self, timeout=1.0):
+        with self.tx_condition:
+            deadline = time.monotonic() + timeout
+            while self.threads and self.tx_pending and time.monotonic() < deadline:
+                self.tx_condition.wait(deadline - time.monotonic())
+            self.closed = True
+            self.tx_condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        for bus in self.buses:
+            bus.shutdown()
 
     # Emogo インスタンスを設定するメソッド
     def set_emogo(self, emogo):
         self.emogo = emogo
 
+class AnimationScheduler:
+    # 連のハイライトと点滅をまとめて管理するクラス
+    # 全ての演出は期限順のヒープで管理し、1つのスレッド（asyncio モードでは1つのコルーチン）で実行する
+    BLINK_INTERVAL = 0.5  # 点滅の間隔（秒）
+    BLINK_COUNT = 3  # 1回のタップで点滅する回数
+    TICK = 0.02  # この時間内に期限が来る処理はまとめて実行する（秒）
+
+    # condition を渡すと、複数の碁盤のスケジューラで1つのロックを共有する（GameHost が1つのスレッドで実行する）
+    def __init__(self, can_interface, threaded=True, clock=time.monotonic, condition=None):
+        self.can_interface = can_interface
+        self.clock = clock  # 現在時刻を返す関数（再生時は記録の時刻を返す）
+        self.condition = condition if condition is not None else threading.Condition()
+        self.timers = []  # (期限, 順番, 処理, 引数)
+        self.sequence = 0
+        self.highlights = {}  # ハイライト中の連 (frozenset) -> 終了時刻
+        self.blink_running = False  # 点滅のブロードキャストを送信中か
+        self.blink_on = False
+        self.wakeup_event = None  # asyncio モードでコルーチンを起こすイベント
+        self.loop = None  # asyncio モードのイベントループと、それを実行するスレッド
+        self.loop_thread = None
+        self.stopped = False  # stop で True にし、スレッドを終了させる
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True  # Daemon thread
+            self.thread.start()
+
+    # 処理を期限付きで登録するメソッド
+    def schedule(self, deadline, action, argument=None):
+        self.sequence += 1
+        heapq.heappush(self.timers, (deadline, self.sequence, action, argument))
+        self.condition.notify_all()
+        if self.wakeup_event is not None:
+            if threading.get_ident() == self.loop_thread:
+                self.wakeup_event.set()
+            else:
+                # asyncio.Event はスレッドセーフではないので、他のスレッド（HintEngine など）からはループに頼む
+                self.loop.call_soon_threadsafe(self.wakeup_event.set)
+
+    # 連をハイライトして点滅させるメソッド
+    # 同じ連が再度タップされた場合は、点滅をやり直す（フレームは送り直さない）
+    def highlight(self, stones):
+        key = frozenset(stones)
+        with self.condition:
+            now = self.clock()
+            if key not in self.highlights:
+                # 石が重なる古いハイライトは新しい連に置き換える
+                for other in [other for other in self.highlights if other & key]:
+                    del self.highlights[other]
+                    self.send_highlight(other - key, False)
+                self.send_highlight(key, True)
+            deadline = now + self.BLINK_INTERVAL * 2 * self.BLINK_COUNT
+            self.highlights[key] = deadline
+            self.schedule(deadline, self.end_highlight, key)
+            if not self.blink_running:
+                self.blink_running = True
+                self.blink_on = False
+                self.schedule(now + self.BLINK_INTERVAL, self.toggle_blink)
+
+    # ハイライトを終了するメソッド（再タップで延長されていれば何もしない）
+    def end_highlight(self, deadline, key):
+        if self.highlights.get(key) == deadline:
+            del self.highlights[key]
+            self.send_highlight(key, False)
+
+    # 点滅のブロードキャストを切り替えるメソッド
+    # ハイライト中の連が全てなくなったら止める
+    def toggle_blink(self, deadline, _):
+        if not self.highlights:
+            if self.blink_on:
+                self.send_blink(False)
+            self.blink_running = False
+            return
+        self.send_blink(not self.blink_on)
+        self.schedule(deadline + self.BLINK_INTERVAL, self.toggle_blink)
+
+    # 連の各石にハイライトの開始・終了を送信するメソッド
+    def send_highlight(self, stones, on):
+        addressing = self.can_interface.addressing
+        for stone_x, stone_y in sorted(stones):
+            bus, can_id = addressing.stone_id(stone_x, stone_y)
+            data = [0x02, 0xFF if on else 0x00]
+            self.can_interface.send_message(can_id, data, CANInterface.PRIORITY_HIGHLIGHT, bus)
+
+    # 全石に点滅の状態を送信するメソッド（ブロードキャスト）
+    def send_blink(self, on):
+        self.blink_on = on
+        self.can_interface.broadcast_message(self.can_interface.addressing.broadcast_id, [0x03, 0xFF if on else 0x00],
+                                             CANInterface.PRIORITY_BLINK)
+
+    # 期限が来た処理をまとめて実行するメソッド
+    # 次の期限までの待ち時間を返す（登録された処理がなければ None）
+    def run_due(self):
+        limit = self.clock() + self.TICK
+        while self.timers and self.timers[0][0] <= limit:
+            deadline, _, action, argument = heapq.heappop(self.timers)
+            try:
+                action(deadline, argument)
+            except Exception as e:
+                # 1つの処理が失敗しても、他の入力と演出は止めない
+                name = getattr(action, '__name__', repr(action))
+                self.can_interface.metrics.count('errors')
+                self.can_interface.metrics.count(f"timer_errors.{name}")
+                logger.error("Error running %s: %s", name, e)
+        if not self.timers:
+            return None
+        return self.timers[0][0] - self.clock()
+
+    # 演出を実行するメソッド（スレッド）
+    def run(self):
+        with self.condition:
+            while not self.stopped:
+                self.condition.wait(self.run_due())
+
+    # 演出のスレッドを止めるメソッド（残っている処理は実行しない）
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    # 演出を実行するコルーチン（asyncio モード）
+    async def run_async(self):
+        import asyncio
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.wakeup_event = asyncio.Event()
+        while True:
+            with self.condition:
+                delay = self.run_due()
+            self.wakeup_event.clear()
+            try:
+                await asyncio.wait_for(self.wakeup_event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+class InputStage:
+    # 石のセンサーからの入力を、落ち着くまで待ってからまとめて Emogo に渡すクラス
+    # 同じ交点の入力は、debounce 秒の間に次の入力がなければ確定する
+    # その間に置かれてから取り除かれた（取り除かれてから置き直された）場合は打ち消し合い、何も処理しない
+    # 確定した入力は、その後 batch 秒以内に確定する他の交点の入力を待ち、まとめて1回で処理する
+    # （死に石をまとめて取り除いた場合など）
+    # 期限は AnimationScheduler のタイマーで管理するので、スレッドも asyncio も同じように動く
+    REMOVED = 0
+    PLACED = 1
+    TAPPED = 2
+
+    def __init__(self, emogo, scheduler, debounce=0.05, batch=0.03):
+        self.emogo = emogo
+        self.scheduler = scheduler
+        self.debounce = debounce  # 0 なら入力をすぐに処理する
+        self.batch = batch
+        self.pending = {}  # (x, y, 種類) -> [入力, 確定する時刻, 順番]
+        self.sequence = 0
+        self.stats = {'events': 0, 'coalesced': 0, 'cancelled': 0, 'batches': 0}
+
+    # 入力を受け付けるメソッド（受信スレッドから呼ばれる）
+    def submit(self, x, y, action):
+        if self.debounce <= 0:
+            with self.scheduler.condition:
+                self.stats['events'] += 1
+                self.stats['batches'] += 1
+                self.emogo.handle_input_batch([(x, y, action)])
+            return
+        # 置く・取り除くは打ち消し合い、タップは別に扱う
+        key = (x, y, 'tap' if action == self.TAPPED else 'stone')
+        with self.scheduler.condition:
+            self.stats['events'] += 1
+            deadline = self.scheduler.clock() + self.debounce
+            entry = self.pending.get(key)
+            if entry is None:
+                self.sequence += 1
+                self.pending[key] = [action, deadline, self.sequence]
+            elif entry[0] != action:
+                # 置いてすぐ取り除いた（取り除いてすぐ置き直した）ので、どちらも処理しない
+                del self.pending[key]
+                self.stats['cancelled'] += 1
+                return
+            else:
+                entry[1] = deadline  # 同じ入力の繰り返しは1つにまとめ、確定を延ばす
+                self.stats['coalesced'] += 1
+            self.scheduler.schedule(deadline, self.flush)
+
+    # 確定した入力をまとめて処理するメソッド（タイマーから呼ばれる）
+    def flush(self, deadline, _):
+        pending = self.pending
+        settled = [entry[1] for entry in pending.values() if entry[1] <= deadline]
+        if not settled:
+            return  # 打ち消された、または確定が延びた入力のタイマー
+        # 最初に確定した入力から batch 秒以内に確定する入力があれば、それを待ってまとめて処理する
+        limit = min(settled) + self.batch
+        later = [entry[1] for entry in pending.values() if deadline < entry[1] <= limit]
+        if later:
+            self.scheduler.schedule(max(later), self.flush)
+            return
+        due = sorted((entry[2], key, entry[0]) for key, entry in pending.items() if entry[1] <= deadline)
+        for _, key, _ in due:
+            del pending[key]
+        self.stats['batches'] += 1
+        self.emogo.handle_input_batch([(x, y, action) for _, (x, y, _), action in due])
+
+    # 入力の統計情報を取得するメソッド
+    def get_stats(self):
+        with self.scheduler.condition:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.pending)
+        return stats
+
+class UndoEntry:
+    # 取り消し・やり直しのための1つの操作の記録
+    def __init__(self, kind, change, before, after, positions):
+        self.kind = kind          # 'move'（着手）、'pass'、'dead'（除去待ち中に置かれた石）、'remove'（石の除去）
+        self.change = change      # 盤面の変更 (BoardChange)
+        self.before = before      # 操作前のゲームの状態
+        self.after = after        # 操作後のゲームの状態
+        self.positions = positions  # 操作で局面の履歴に追加されたハッシュ値
+
 class Emogo:
-    def __init__(self, board_size_n=9, board_size_m=9):
+    # コウのルール: 'simple' は直前の局面に戻す着手を、'superko' は過去に現れた局面に戻す着手を禁止する
+    KO_RULES = ('simple', 'superko', None)
+
+    # 着手を拒否したときに石に送る命令と理由
+    COMMAND_ILLEGAL_MOVE = 4
+    ILLEGAL_KO = 1
+    ILLEGAL_SUPERKO = 2
+
+    # 全体の再送信をまとめたフレームで送る場合（bulk_resync）の命令（各バスにブロードキャスト ID で送る）
+    #   データ: [5, 行, 列の区切り | 番号 << 4, 交点の状態 5バイト]
+    #   行は石の CAN ID での行番号。列の区切り p のフレームは列 10p+1 〜 10p+10 を表す
+    #   交点の状態は1交点4ビット（色 | 感情 << 2、空点は 0）で、列の順に下位4ビットから詰める
+    #   番号は再送信ごとに1増える（4ビット）。石の向きは入らないので、北以外を向いた石には個別のフレームも送る
+    #   各碁盤のマイコンは自分の行と列の区切りのフレームだけを取り出し、空点の分は石に送らない
+    #   マイコンは自分の行と列を CAN ID の上位・下位4ビットから求めるので、'nibble' の形式でしか使えない
+    COMMAND_BULK_STATE = 5
+    BULK_POINTS = 10  # まとめたフレーム1つに入る交点の数
+
+    def __init__(self, board_size_n=9, board_size_m=9, use_asyncio=False, ko_rule='simple',
+                 channel='can0', bustype='socketcan', use_keyboard=True, metrics=None, clock=time.monotonic,
+                 addressing=None, scoring='area', komi=6.5, live_score=False, undo_limit=100, debounce=0.05,
+                 can_interface=None, animations=None, bulk_resync=False):
+        if ko_rule not in self.KO_RULES:
+            raise ValueError("Invalid ko rule")
         self.board = Board(board_size_n, board_size_m)
-        self.can_interface = CANInterface()
+        self.ko_rule = ko_rule
+        self.position_history = [self.board.position_hash]  # 着手ごとの局面のハッシュ値
+        self.position_set = {self.board.position_hash}  # 過去に現れた局面
+        self.illegal_stones = set()  # 着手を拒否された（取り除かれるのを待つ）石
+        self.scorer = Scorer(self.board, scoring, komi)
+        self.captures = {'black': 0, 'white': 0}  # 各色が取った石の数（アゲハマ）
+        self.live_score = live_score  # 着手ごとに形勢を表示するか
+        self.undo_stack = collections.deque(maxlen=undo_limit)  # 取り消せる操作（古いものから捨てる）
+        self.redo_stack = []  # 取り消した操作
+        # 取り消し・やり直しで、実際の碁盤と食い違った石
+        self.stones_to_remove = set()  # 盤面にはないが、碁盤に残っている石
+        self.stones_to_place = set()   # 盤面にはあるが、碁盤から取り除かれている石
+        # asyncio モードでは受信・送信・キーボード入力・点滅を1つのイベントループで処理する
+        self.use_asyncio = use_asyncio
+        self.use_keyboard = use_keyboard
+        self.metrics = metrics if metrics is not None else Metrics()
+        # channel にリストを渡すと、碁盤の行を複数のバスに分ける（addressing で CAN ID の形式を指定できる）
+        # can_interface と animations を渡すと、それを使う（GameHost で複数の碁盤がバスとスレッドを共有する場合）
+        if can_interface is None:
+            if addressing is None:
+                buses = 1 if isinstance(channel, str) else len(channel)
+                addressing = Addressing(board_size_n, board_size_m, buses)
+            can_interface = CANInterface(channel, bustype, threaded=not use_asyncio, metrics=self.metrics,
+                                         addressing=addressing)
+        self.can_interface = can_interface
+        if bulk_resync and can_interface.addressing.scheme != 'nibble':
+            raise ValueError(f"Bulk resync needs the 'nibble' addressing scheme, "
+                             f"not '{can_interface.addressing.scheme}'")
+        if animations is None:
+            animations = AnimationScheduler(self.can_interface, threaded=not use_asyncio, clock=clock)
+        self.animations = animations
+        self.inputs = InputStage(self, self.animations, debounce)  # 石のセンサーの入力のチャタリングを取り除く
+        self.metrics.add_gauge('input', self.inputs.get_stats)
+        self.flush_deferred = False  # まとめて処理している間は、石の状態の送信を最後の1回にまとめる
+        self.publisher = None  # 盤面の状態を他のプロセスに公開する BoardPublisher
+        self.game_journal = None  # 状態の変化を記録し、落ちた後に対局を再開できるようにする GameJournal
+        self.hint_engine = None  # ダブルタップで次の一手の候補を探す HintEngine
+        self.sgf_writer = None  # 対局を1手ごとに棋譜（SGF）に書き出す SGFWriter
+        self.bulk_resync = bulk_resync  # 全体の再送信をまとめたフレームで送るか
+        self.bulk_sequence = 0
         self.current_player = 'black'  # 黒石が先攻
         self.game_over = False
+        self.game_over_event = None  # asyncio モードでゲーム終了を通知するイベント
         self.waiting_for_dead_stones_removal = False  # 死に石の除去待ちフラグ
         self.dead_stones_list = []  # 死に石のリスト
         self.can_interface.set_emogo(self)  # CANInterfaceにEmogoのインスタンスを設定
         self.consecutive_passes = 0  # 連続パス回数
-        self.input_thread = threading.Thread(target=self.handle_keyboard_input)
-        self.input_thread.daemon = True  # Daemon thread
-        self.input_thread.start()
+        if use_keyboard and not use_asyncio:
+            self.input_thread = threading.Thread(target=self.handle_keyboard_input)
+            self.input_thread.daemon = True  # Daemon thread
+            self.input_thread.start()
 
     # ゲームを開始するメソッド
     def start_game(self):
-        print("Game started! Black goes first.")
+        logger.info("Game started! Black goes first.")
         self.game_thread = threading.Thread(target=self.game_loop)
         self.game_thread.daemon = True  # Daemon thread
         self.game_thread.start()
@@ -398,40 +654,140 @@ class Emogo:
         while not self.game_over:
             time.sleep(0.1)  # 100ms 待機
 
+    # asyncio のイベントループ上でゲームを実行するコルーチン
+    async def run(self):
+        import asyncio
+        logger.info("Game started! Black goes first.")
+        self.game_over_event = asyncio.Event()
+        tasks = [asyncio.create_task(self.animations.run_async())]
+        for bus in range(len(self.can_interface.buses)):
+            tasks.append(asyncio.create_task(self.can_interface.receive_messages_async(bus)))
+            tasks.append(asyncio.create_task(self.can_interface.transmit_messages_async(bus)))
+        if self.use_keyboard:
+            tasks.append(asyncio.create_task(self.handle_keyboard_input_async()))
+        try:
+            await self.game_over_event.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    # タイマーと受信・送信のスレッドを止め、バスを閉じるメソッド
+    def shutdown(self):
+        self.end_game()
+        self.animations.stop()
+        self.can_interface.shutdown()
+
+    # ゲームを終了するメソッド
+    def end_game(self):
+        self.game_over = True
+        if self.game_over_event is not None:
+            self.game_over_event.set()
+
     # キーボード入力を処理するメソッド
     def handle_keyboard_input(self):
         while not self.game_over:
-            user_input = input()
+            self.handle_command(input())
+
+    # キーボード入力を処理するコルーチン（asyncio モード）
+    async def handle_keyboard_input_async(self):
+        import asyncio
+        reader = asyncio.StreamReader()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        except ValueError:
+            logger.warning("Keyboard input is not available.")
+            return
+        while not self.game_over:
+            user_input = await reader.readline()
+            if not user_input:  # 標準入力が閉じられた
+                break
+            self.handle_command(user_input.decode().strip())
+
+    # キーボードからのコマンドを処理するメソッド
+    # 盤面はタイマーのスレッドでも変わるので、同じロックの中で処理する
+    def handle_command(self, user_input):
+        with self.animations.condition:
             if user_input.lower() == 'pass':
                 self.handle_pass()
+            elif user_input.lower() == 'resync':
+                self.resync_board()
             elif user_input.lower() == 'quit':
-                print("Game terminated by user.")
-                self.game_over = True
-                sys.exit()
+                logger.info("Game terminated by user.")
+                self.end_game()
+            elif user_input.lower() == 'frames':
+                self.show_recent_frames()
+            elif user_input.lower() == 'undo':
+                self.undo()
+            elif user_input.lower() == 'redo':
+                self.redo()
+            elif user_input.lower() == 'hint':
+                self.request_hint()
             else:
-                print("Unknown command. Type 'pass' to pass your turn or 'quit' to exit.")
+                logger.info("Unknown command. Type 'pass' to pass your turn, 'undo' or 'redo' to take back or replay "
+                            "a move, 'hint' to get a suggested move, 'resync' to resend all stones, "
+                            "'frames' to show recent CAN frames or 'quit' to exit.")
+
+    # 確定した石のセンサーの入力 [(x, y, 入力), ...] を順に処理し、状態が変わった石をまとめて送信するメソッド
+    def handle_input_batch(self, events):
+        start = time.perf_counter_ns()
+        self.flush_deferred = True
+        try:
+            for x, y, action in events:
+                if action == InputStage.REMOVED:
+                    self.handle_stone_removed(x, y)
+                elif action == InputStage.PLACED:
+                    self.handle_stone_placed(x, y)
+                else:
+                    self.handle_stone_tapped(x, y)
+        finally:
+            self.flush_deferred = False
+        self.flush_stone_updates()
+        self.metrics.observe('input.batch', start)
+
+    # 直近に送受信したフレームを表示するメソッド
+    def show_recent_frames(self):
+        frames = self.can_interface.recent_frames.dump()
+        logger.info("Recent CAN frames (%d):\n%s", len(frames), '\n'.join(frames))
 
     # パスを処理するメソッド
     def handle_pass(self):
         if self.waiting_for_dead_stones_removal:
-            print("Cannot pass while waiting for dead stones to be removed.")
+            logger.info("Cannot pass while waiting for dead stones to be removed.")
             return
 
-        print(f"{self.current_player.capitalize()} passed.")
+        logger.info("%s passed.", self.current_player.capitalize())
+        before = self.begin_action()
+        self.record_position()
         self.consecutive_passes += 1
-        if self.consecutive_passes >= 2:
-            print("Both players have passed consecutively. The game is over.")
-            self.game_over = True
-            self.calculate_final_score()
-        else:
+        if self.consecutive_passes < 2:
             self.switch_player()
+        # 手番を交代してから記録する（やり直し・再開したときに次の手番になるように）
+        self.end_action('pass', before)
+        if self.consecutive_passes >= 2:
+            logger.info("Both players have passed consecutively. The game is over.")
+            self.end_game()
+            result = self.calculate_final_score()
+            if self.sgf_writer is not None:
+                self.sgf_writer.finish(result)
+        self.publish_state()
 
     # 石が置かれたことを処理するメソッド
     def handle_stone_placed(self, x, y):
         if self.game_over:
-            print("Game is over. No more moves can be made.")
+            logger.info("Game is over. No more moves can be made.")
+            return
+        if (x, y) in self.stones_to_place:
+            # 取り消しで盤面に戻した石が碁盤に置き直された
+            self.stones_to_place.discard((x, y))
+            self.board.mark_unflushed(x, y)
+            self.flush_stone_updates()
+            logger.info("Stone at (%d, %d) was put back.", x, y)
             return
+        self.stones_to_remove.discard((x, y))
 
+        kind = 'dead' if self.waiting_for_dead_stones_removal else 'move'
+        before = self.begin_action()
         try:
             if self.waiting_for_dead_stones_removal:
                 # 死に石除去待ちの場合、新しい石は死に石とする
@@ -440,86 +796,295 @@ class Emogo:
                 self.board.set_stone_state(x, y, emotion='dead')
                 # 追加された石を死に石リストに追加
                 self.dead_stones_list.append((x, y))
-                # 更新した石の状態を送信
-                stone = self.board.get_stone(x, y)
-                stone_info = {
-                    'x': x,
-                    'y': y,
-                    'color': stone.get_color(),
-                    'emotion': stone.get_emotion(),
-                    'direction': stone.get_direction()
-                }
-                self.send_stone_update(stone_info)
+                # 状態が変わった石だけを送信
+                self.flush_stone_updates()
                 self.display_board(self.board)
-                print(f"Stone placed at ({x}, {y}) is immediately dead.")
+                logger.info("Stone placed at (%d, %d) is immediately dead.", x, y)
             else:
                 color = self.current_player
+                violation = self.check_ko(x, y, color)
+                if violation is not None:
+                    self.reject_move(x, y, violation)
+                    return
+                start = time.perf_counter_ns()
                 self.board.place_stone(x, y, color)
+                self.metrics.observe('rules.place_stone', start)
+                self.record_position()
                 self.update_board_state()
                 self.display_board(self.board)
-                print(f"{self.current_player.capitalize()} placed a stone at ({x}, {y}).")
+                logger.info("%s placed a stone at (%d, %d).", self.current_player.capitalize(), x, y)
                 self.consecutive_passes = 0  # パス回数をリセット
                 self.check_for_dead_stones()
+                self.show_score_estimate()
                 if not self.waiting_for_dead_stones_removal:
                     self.switch_player()
         except Exception as e:
-            print(f"Error: {e}")
+            self.metrics.count('errors')
+            logger.error("Error: %s", e)
+        finally:
+            self.end_action(kind, before)
+
+    # 着手がコウのルールに違反するか判定するメソッド（違反の理由、または None を返す）
+    def check_ko(self, x, y, color):
+        if self.ko_rule is None:
+            return None
+        new_hash = self.board.hash_after_move(x, y, color)
+        if self.ko_rule == 'simple':
+            if len(self.position_history) >= 2 and new_hash == self.position_history[-2]:
+                return self.ILLEGAL_KO
+        elif new_hash in self.position_set:
+            return self.ILLEGAL_SUPERKO
+        return None
+
+    # 着手を拒否し、置かれた石に通知するメソッド
+    def reject_move(self, x, y, reason):
+        self.illegal_stones.add((x, y))
+        rule = 'ko' if reason == self.ILLEGAL_KO else 'superko'
+        logger.info("Illegal move at (%d, %d) (%s). Please remove the stone.", x, y, rule)
+        bus, can_id = self.can_interface.addressing.stone_id(x, y)
+        self.can_interface.send_message(can_id, [self.COMMAND_ILLEGAL_MOVE, reason], bus=bus)
+
+    # 現在の局面を履歴に記録するメソッド
+    def record_position(self):
+        self.position_history.append(self.board.position_hash)
+        self.position_set.add(self.board.position_hash)
 
     # 石が取り除かれたことを処理するメソッド
     def handle_stone_removed(self, x, y):
+        if (x, y) in self.illegal_stones:
+            # 拒否された石は盤面に置かれていないので、取り除かれたことだけを記録する
+            self.illegal_stones.remove((x, y))
+            logger.info("Illegal stone at (%d, %d) was removed.", x, y)
+            return
+        if (x, y) in self.stones_to_remove:
+            # 取り消した着手の石が碁盤から取り除かれた
+            self.stones_to_remove.discard((x, y))
+            logger.info("Stone at (%d, %d) was taken back.", x, y)
+            return
+
+        before = self.begin_action()
         try:
             self.board.remove_stone(x, y)
             # 石が取り除かれたら、死に石リストから削除
             if (x, y) in self.dead_stones_list:
                 self.dead_stones_list.remove((x, y))
             self.display_board(self.board)
-            print(f"Stone at ({x}, {y}) was removed.")
+            logger.info("Stone at (%d, %d) was removed.", x, y)
             # 死に石リストが空か確認
             if not self.dead_stones_list:
                 self.waiting_for_dead_stones_removal = False
-                print("All dead stones have been removed. Game resumes.")
+                logger.info("All dead stones have been removed. Game resumes.")
                 self.switch_player()
             else:
                 # まだ死に石が残っている場合、リストを表示
-                print("Please remove the remaining dead stones:")
+                logger.info("Please remove the remaining dead stones:")
                 for x_remain, y_remain in self.dead_stones_list:
-                    print(f"- Stone at ({x_remain}, {y_remain})")
+                    logger.info("- Stone at (%d, %d)", x_remain, y_remain)
         except Exception as e:
-            print(f"Error: {e}")
+            self.metrics.count('errors')
+            logger.error("Error: %s", e)
+        finally:
+            self.end_action('remove', before)
+
+    # ゲームの状態（盤面以外）を取得するメソッド
+    def game_state(self):
+        return {
+            'current_player': self.current_player,
+            'consecutive_passes': self.consecutive_passes,
+            'waiting_for_dead_stones_removal': self.waiting_for_dead_stones_removal,
+            'dead_stones_list': list(self.dead_stones_list),
+            'captures': dict(self.captures),
+            'history_length': len(self.position_history)
+        }
+
+    # ゲームの状態（盤面以外）を戻すメソッド（positions は局面の履歴に追加し直すハッシュ値）
+    def set_game_state(self, state, positions=()):
+        self.current_player = state['current_player']
+        self.consecutive_passes = state['consecutive_passes']
+        self.waiting_for_dead_stones_removal = state['waiting_for_dead_stones_removal']
+        self.dead_stones_list = list(state['dead_stones_list'])
+        self.captures = dict(state['captures'])
+        del self.position_history[state['history_length'] - len(positions):]
+        self.position_history.extend(positions)
+        self.position_set = set(self.position_history)
+
+    # 操作の記録を開始するメソッド（操作前のゲームの状態を返す）
+    def begin_action(self):
+        self.board.begin_change()
+        return self.game_state()
+
+    # 操作の記録を終了し、取り消せる操作として保存するメソッド（盤面が変わらなかった操作は保存しない）
+    def end_action(self, kind, before):
+        change = self.board.end_change()
+        if not change.deltas and kind != 'pass':
+            return
+        positions = self.position_history[before['history_length']:]
+        after = self.game_state()
+        entry = UndoEntry(kind, change, before, after, positions)
+        self.undo_stack.append(entry)
+        self.redo_stack = []
+        self.journal_change([(p, new) for p, _, new in change.deltas], change.hash_after, after, positions)
+        self.record_move(entry)
+
+    # 着手・パスを棋譜に書き足すメソッド（書き出し先が設定されている場合のみ、石の除去などは書かない）
+    def record_move(self, entry):
+        if self.sgf_writer is None or entry.kind not in ('move', 'pass'):
+            return
+        position = None
+        for p, old, new in entry.change.deltas:
+            if not old & Board.COLOR_MASK and new & Board.COLOR_MASK:
+                position = self.board.to_position(p)  # 置かれた石（取られた石は死に石になるだけで消えない）
+        self.sgf_writer.add(entry.before['current_player'], position)
+
+    # 状態の変化を GameJournal に記録するメソッド（記録先が設定されている場合のみ）
+    def journal_change(self, values, position_hash, state, positions=()):
+        if self.game_journal is not None:
+            self.game_journal.log(self, values, position_hash, state, positions)
+
+    # 最後の着手（またはパス）を、その後の石の除去も含めて取り消すメソッド
+    def undo(self):
+        if self.game_over:
+            logger.info("Game is over. Moves cannot be undone.")
+            return
+        if not self.undo_stack:
+            logger.info("Nothing to undo.")
+            return
+        while self.undo_stack:
+            entry = self.undo_stack.pop()
+            self.board.revert(entry.change)
+            self.set_game_state(entry.before)
+            self.journal_change([(p, old) for p, old, _ in entry.change.deltas], entry.change.hash_before,
+                                entry.before)
+            self.track_physical_stones((p, new, old) for p, old, new in entry.change.deltas)
+            if self.sgf_writer is not None and entry.kind in ('move', 'pass'):
+                self.sgf_writer.undo()
+            self.redo_stack.append(entry)
+            if entry.kind in ('move', 'pass'):
+                break
+        logger.info("Undid the last %s.", 'pass' if entry.kind == 'pass' else 'move')
+        self.finish_history_change()
+
+    # 取り消した着手（またはパス）を、その後の石の除去も含めてやり直すメソッド
+    def redo(self):
+        if self.game_over:
+            logger.info("Game is over. Moves cannot be redone.")
+            return
+        if not self.redo_stack:
+            logger.info("Nothing to redo.")
+            return
+        kind = self.redo_stack[-1].kind
+        entry = self.redo_stack.pop()
+        while True:
+            self.board.reapply(entry.change)
+            self.set_game_state(entry.after, entry.positions)
+            self.journal_change([(p, new) for p, _, new in entry.change.deltas], entry.change.hash_after,
+                                entry.after, entry.positions)
+            self.track_physical_stones(entry.change.deltas)
+            self.record_move(entry)
+            self.undo_stack.append(entry)
+            if not self.redo_stack or self.redo_stack[-1].kind in ('move', 'pass'):
+                break
+            entry = self.redo_stack.pop()
+        logger.info("Redid the %s.", 'pass' if kind == 'pass' else 'move')
+        self.finish_history_change()
+
+    # 盤面の変更で石が現れた・消えた交点を、実際の碁盤と食い違った石として記録するメソッド
+    # transitions は (交点, 変更前の値, 変更後の値) のリスト
+    def track_physical_stones(self, transitions):
+        for p, before, after in transitions:
+            had_stone = before & Board.COLOR_MASK
+            has_stone = after & Board.COLOR_MASK
+            if had_stone == has_stone:
+                continue
+            position = self.board.to_position(p)
+            if had_stone:
+                if position in self.stones_to_place:
+                    self.stones_to_place.discard(position)
+                else:
+                    self.stones_to_remove.add(position)
+            if has_stone:
+                if position in self.stones_to_remove:
+                    self.stones_to_remove.discard(position)
+                else:
+                    self.stones_to_place.add(position)
+
+    # 取り消し・やり直しの後に、変わった石だけを送信して状態を表示するメソッド
+    def finish_history_change(self):
+        self.flush_stone_updates()
+        self.display_board(self.board)
+        for x, y in sorted(self.stones_to_remove):
+            logger.info("- Please take back the stone at (%d, %d)", x, y)
+        for x, y in sorted(self.stones_to_place):
+            logger.info("- Please put back the stone at (%d, %d)", x, y)
+        logger.info("Now it's %s's turn.", self.current_player.capitalize())
 
     # 石がタップされたことを処理するメソッド
     def handle_stone_tapped(self, x, y):
         try:
-            print(f"Stone at ({x}, {y}) was tapped.")
+            logger.info("Stone at (%d, %d) was tapped.", x, y)
             connected_stones = self.board.get_connect(x, y)
             if connected_stones:
-                # タップされた石と連絡する全ての石にメッセージを送信
-                for stone_x, stone_y in connected_stones:
-                    can_id = 0x400 | (stone_x << 4) | stone_y
-                    data = [0x02, 0xFF]
-                    self.can_interface.send_message(can_id, data)
-                # 0.5秒待機してから全石に対してメッセージを送信
-                def blink_stones():
-                    for _ in range(3):
-                        time.sleep(0.5)
-                        # 全石に対してメッセージを送信（ブロードキャスト）
-                        can_id = 0x1FF
-                        data_on = [0x03, 0xFF]
-                        data_off = [0x03, 0x00]
-                        self.can_interface.send_message(can_id, data_on)
-                        time.sleep(0.5)
-                        self.can_interface.send_message(can_id, data_off)
-                    # 最後に連絡する各石にメッセージを送信
-                    for stone_x, stone_y in connected_stones:
-                        can_id = 0x400 | (stone_x << 4) | stone_y
-                        data = [0x02, 0x00]
-                        self.can_interface.send_message(can_id, data)
-                # 点滅処理を別スレッドで実行
-                threading.Thread(target=blink_stones).start()
+                # タップされた石と連絡する全ての石をハイライトして点滅させる
+                self.animations.highlight(connected_stones)
             else:
-                print(f"No connected stones found for ({x}, {y})")
+                logger.info("No connected stones found for (%d, %d)", x, y)
         except Exception as e:
-            print(f"Error handling stone tap: {e}")
+            self.metrics.count('errors')
+            logger.error("Error handling stone tap: %s", e)
+
+    # 次の一手の候補と、一番弱い連を探すメソッド（石がダブルタップされたとき、またはキーボードの 'hint'）
+    # 探すのは HintEngine のスレッドとプロセスで行い、結果はタイマーのスレッドで show_hint が表示する
+    # (x, y) を指定すると、その石の色の一番弱い連を探す（指定しなければ手番の色）
+    def request_hint(self, x=None, y=None):
+        if self.hint_engine is None:
+            logger.info("Hints are not enabled.")
+            return
+        from emogo_hint import Position
+        with self.animations.condition:
+            if self.game_over or self.waiting_for_dead_stones_removal:
+                logger.info("No hints while the game is over or dead stones are waiting to be removed.")
+                return
+            stone = self.board.get_stone(x, y) if x is not None else None
+            color = stone.get_color() if stone is not None else Stone.COLOR_VALUES[self.current_player]
+            position = Position(self.board, Stone.COLOR_VALUES[self.current_player], self.scorer.komi)
+            chains = [sorted(chain.stones) for chain in set(self.board.chains)
+                      if chain is not None and chain.color == color]
+        logger.info("Looking for a hint for %s...", self.current_player.capitalize())
+
+        # 結果をタイマーのスレッドに渡す（HintEngine のスレッドから呼ばれる）
+        def deliver(hint):
+            with self.animations.condition:
+                self.animations.schedule(self.animations.clock(), self.show_hint, (hint, color, chains))
+
+        self.hint_engine.submit(position, deliver, self)
+
+    # 探したヒントを表示し、一番弱い連をハイライトするメソッド（探している間に盤面が変わっていれば捨てる）
+    def show_hint(self, deadline, argument):
+        hint, color, chains = argument
+        position = hint.position
+        if (position.position_hash != self.board.position_hash
+                or position.player != Stone.COLOR_VALUES[self.current_player] or self.game_over):
+            logger.info("The board changed while looking for a hint.")
+            return
+        if not hint.playouts:
+            logger.info("No playouts finished in time for a hint.")
+            return
+        player = self.current_player
+        for p, rate, visits in hint.moves:
+            x, y = self.board.to_position(p)
+            if self.board.get_stone(x, y) is None and self.check_ko(x, y, player) is None:
+                logger.info("Hint for %s: (%d, %d) (wins %.0f%% of %d playouts, %d playouts in %.2f s)",
+                            player.capitalize(), x, y, rate * 100, visits, hint.playouts, hint.elapsed)
+                break
+        else:
+            logger.info("Hint for %s: pass (%d playouts in %.2f s)", player.capitalize(), hint.playouts, hint.elapsed)
+        weakest = hint.weakest(chains)
+        if weakest is not None:
+            stones, rate = weakest
+            positions = [self.board.to_position(p) for p in stones]
+            name = 'black' if color == Stone.COLOR_VALUES['black'] else 'white'
+            logger.info("Weakest %s group: %s (survives %.0f%% of playouts)", name, positions, rate * 100)
+            self.animations.highlight(positions)
 
     # 死に石があるかチェックし、処理を行う
     def check_for_dead_stones(self):
@@ -527,9 +1092,13 @@ class Emogo:
         if dead_stones:
             self.waiting_for_dead_stones_removal = True
             self.dead_stones_list = dead_stones.copy()
-            print("Dead stones detected. Please remove the following stones:")
+            # 死に石は相手の色のアゲハマになる（自殺手の場合は相手が取ったことになる）
             for x, y in dead_stones:
-                print(f"- Stone at ({x}, {y})")
+                color = self.board.get_stone(x, y).get_color()
+                self.captures['white' if color == Stone.COLOR_VALUES['black'] else 'black'] += 1
+            logger.info("Dead stones detected. Please remove the following stones:")
+            for x, y in dead_stones:
+                logger.info("- Stone at (%d, %d)", x, y)
         else:
             self.waiting_for_dead_stones_removal = False
             self.dead_stones_list = []
@@ -547,16 +1116,67 @@ class Emogo:
     def update_board_state(self):
         # Boardの状態を更新（感情などの再計算はBoard内で行われる）
         stone_counts = self.board.stone_counts()
-        print(f"Black stones: {stone_counts['black']}, White stones: {stone_counts['white']}")
+        logger.info("Black stones: %s, White stones: %s", stone_counts['black'], stone_counts['white'])
 
-        # 各石に状態を通知
-        board_state = self.board.get_board_state()
-        for stone_info in board_state:
+        # 状態が変わった石にだけ通知
+        self.flush_stone_updates()
+
+    # 前回の送信以降に状態が変わった石にだけ状態を送信するメソッド
+    def flush_stone_updates(self):
+        if self.flush_deferred:
+            return
+        start = time.perf_counter_ns()
+        changed_states = self.board.pop_changed_states()
+        self.metrics.observe('state.diff', start)
+        for stone_info in changed_states:
             self.send_stone_update(stone_info)
+        self.publish_state()
+
+    # 盤面の状態を他のプロセスに公開するメソッド（公開先が設定されている場合のみ）
+    def publish_state(self):
+        if self.publisher is not None:
+            self.publisher.publish(self)
+
+    # 全ての石に状態を送信し直すメソッド（石が再起動したときなど）
+    def resync_board(self):
+        logger.info("Resending the state of all stones.")
+        if self.bulk_resync:
+            self.send_bulk_states()
+        else:
+            for stone_info in self.board.get_board_state():
+                self.send_stone_update(stone_info)
+        self.board.mark_all_flushed()
+
+    # 全ての交点の色と感情を、まとめたフレームで送信するメソッド（石がない交点も空点として送る）
+    def send_bulk_states(self):
+        self.bulk_sequence = (self.bulk_sequence + 1) & 0x0F
+        addressing = self.can_interface.addressing
+        board = self.board
+        points = board.points
+        parts = -(-board.m // self.BULK_POINTS)
+        for bus, rows in enumerate(addressing.bus_rows):
+            for row, x in rows:
+                start = board.to_point(x, 1)
+                for part in range(parts):
+                    packed = bytearray(self.BULK_POINTS // 2)
+                    states = points[start + part * self.BULK_POINTS:start + min(board.m, (part + 1) * self.BULK_POINTS)]
+                    for k, value in enumerate(states):
+                        packed[k >> 1] |= (value & (Board.COLOR_MASK | Board.EMOTION_MASK)) << (k & 1) * 4
+                    data = [self.COMMAND_BULK_STATE, row, part | self.bulk_sequence << 4, *packed]
+                    self.can_interface.send_message(addressing.broadcast_id, data, bus=bus, slot=(row, part))
+        # 向きはまとめたフレームに入らないので、北以外を向いた石には個別に送る
+        for stone_info in board.get_board_state():
+            if stone_info['direction'] != Stone.DIRECTION_VALUES['north']:
+                self.send_stone_update(stone_info)
+
+    # 石から再送信の要求を受けたことを処理するメソッド
+    def handle_resync_request(self, x, y):
+        logger.info("Stone at (%d, %d) requested a resync.", x, y)
+        self.resync_board()
 
     # 石に状態を送信するメソッド
     def send_stone_update(self, stone_info):
-        can_id = 0x400 | (stone_info['x'] << 4) | stone_info['y']
+        bus, can_id = self.can_interface.addressing.stone_id(stone_info['x'], stone_info['y'])
         command = 1  # 状態変更の命令コードは1
         color = stone_info['color']
         emotion = stone_info['emotion']
@@ -570,52 +1190,158 @@ class Emogo:
             direction_high,
             direction_low
         ]
-        self.can_interface.send_message(can_id, data)
+        self.can_interface.send_message(can_id, data, bus=bus)
 
     # プレイヤーを交代するメソッド
     def switch_player(self):
         self.current_player = 'white' if self.current_player == 'black' else 'black'
-        print(f"Now it's {self.current_player.capitalize()}'s turn.")
+        logger.info("Now it's %s's turn.", self.current_player.capitalize())
 
-    # 最終スコアを計算するメソッド（簡易的な実装）
+    # 最終スコアを計算するメソッド
     def calculate_final_score(self):
-        stone_counts = self.board.stone_counts()
-        print(f"Final Score:")
-        print(f"Black stones: {stone_counts['black']}")
-        print(f"White stones: {stone_counts['white']}")
-        if stone_counts['black'] > stone_counts['white']:
-            print("Black wins!")
-        elif stone_counts['white'] > stone_counts['black']:
-            print("White wins!")
+        result = self.scorer.score(self.captures)
+        logger.info("Final Score (%s scoring, komi %s):", result['rule'], result['komi'])
+        for name in ('black', 'white'):
+            score = result[name]
+            logger.info("%s: %s (stones %d, territory %d, captures %d)", name.capitalize(), score['total'],
+                        score['stones'], score['territory'], score['captures'])
+        if result['winner'] is None:
+            logger.info("It's a tie!")
         else:
-            print("It's a tie!")
+            logger.info("%s wins by %s!", result['winner'].capitalize(), result['margin'])
+        return result
+
+    # 現在の形勢を表示するメソッド（石の状態を送信した後に呼ぶ）
+    def show_score_estimate(self):
+        if not self.live_score or not logger.isEnabledFor(logging.INFO):
+            return
+        start = time.perf_counter_ns()
+        result = self.scorer.score(self.captures)
+        self.metrics.observe('score.estimate', start)
+        leader = 'B' if result['winner'] == 'black' else 'W' if result['winner'] == 'white' else '='
+        logger.info("Score estimate: Black %s, White %s (%s+%s)", result['black']['total'], result['white']['total'],
+                    leader, result['margin'])
 
     # 碁盤の状態を表示するメソッド
+    # 描画は書き出しスレッドで行うので、ここでは交点の値をコピーするだけ（ログが無効なら何もしない）
     def display_board(self, board):
-        for x in range(1, board.n + 1):
-            row = []
-            for y in range(1, board.m + 1):
-                stone = board.get_stone(x, y)
-                if stone is None:
-                    row.append('.')
-                else:
-                    emotion = stone.get_emotion()
-                    color = stone.get_color()
-                    if emotion == Stone.EMOTION_VALUES['dead']:
-                        symbol = 'X' if color == Stone.COLOR_VALUES['black'] else 'x'
-                    elif emotion == Stone.EMOTION_VALUES['defensive']:
-                        symbol = 'D' if color == Stone.COLOR_VALUES['black'] else 'd'
-                    elif emotion == Stone.EMOTION_VALUES['offensive']:
-                        symbol = 'O' if color == Stone.COLOR_VALUES['black'] else 'o'
-                    else:  # normal
-                        symbol = '○' if color == Stone.COLOR_VALUES['black'] else '●'
-                    row.append(symbol)
-            print(' '.join(row))
-        print()  # 改行
+        if board_logger.isEnabledFor(logging.DEBUG):
+            board_logger.debug("%s", Lazy(self.render_board, board, bytes(board.points)))
+
+    # 碁盤を文字列で表すメソッド（points を渡すと、その交点の値で表す）
+    def render_board(self, board, points=None):
+        black = Stone.COLOR_VALUES['black']
+        white = Stone.COLOR_VALUES['white']
+        symbols = {}
+        for emotion, black_symbol, white_symbol in (('dead', 'X', 'x'), ('defensive', 'D', 'd'),
+                                                    ('normal', '○', '●'), ('offensive', 'O', 'o')):
+            symbols[(black, Stone.EMOTION_VALUES[emotion])] = black_symbol
+            symbols[(white, Stone.EMOTION_VALUES[emotion])] = white_symbol
+        rows = [' '.join(symbols.get(state, '.') for state in board.get_row(x, points)) for x in range(1, board.n + 1)]
+        return '\n'.join(rows) + '\n'  # 最後に空行
 
 # ゲームを開始
 if __name__ == "__main__":
-    game = Emogo(5, 5)
+    import argparse
+    parser = argparse.ArgumentParser(description="EmoGo game controller")
+    parser.add_argument('--asyncio', action='store_true', help="run everything on one asyncio event loop")
+    parser.add_argument('--superko', action='store_true', help="use the positional superko rule instead of simple ko")
+    parser.add_argument('--size', type=int, default=5, help="board size")
+    parser.add_argument('--scoring', default='area', choices=Scorer.RULES, help="scoring rule")
+    parser.add_argument('--komi', type=float, default=6.5, help="points given to white")
+    parser.add_argument('--live-score', action='store_true', help="show a score estimate after every move")
+    parser.add_argument('--channel', action='append',
+                        help="CAN channel (repeat to split the board across buses, e.g. --channel can0 --channel can1)")
+    parser.add_argument('--addressing', choices=Addressing.SCHEMES,
+                        help="CAN ID scheme (default: the most compact scheme that fits; "
+                             "'extended' only works on virtual buses)")
+    parser.add_argument('--stats-file', help="write latency metrics to this JSON file every second")
+    parser.add_argument('--stats-socket', help="serve latency metrics on this Unix socket")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="level of the game log")
+    parser.add_argument('--log-frames', action='store_true', help="dump every CAN frame sent and received")
+    parser.add_argument('--log-board', action='store_true', help="draw the board after every move")
+    parser.add_argument('--record', help="append every CAN frame sent and received to this log file")
+    parser.add_argument('--debounce', type=float, default=0.05,
+                        help="seconds a stone sensor must stay quiet before its event is handled (0 to disable)")
+    parser.add_argument('--bulk-resync', action='store_true',
+                        help="resend the whole board as a few packed broadcast frames instead of one frame per stone "
+                             "(needs the 'nibble' addressing)")
+    parser.add_argument('--publish', help="publish the live board to this memory-mapped file (e.g. /dev/shm/emogo-board)")
+    parser.add_argument('--journal', help="journal the game to this file and resume it from there after a crash")
+    parser.add_argument('--sgf', help="write the game record to this SGF file as the game goes on")
+    parser.add_argument('--hints', action='store_true',
+                        help="suggest a move and show the weakest group when a stone is double-tapped")
+    parser.add_argument('--hint-deadline', type=float, default=0.5, help="seconds to look for a hint")
+    parser.add_argument('--hint-workers', type=int, help="processes running playouts (default: one per core)")
+    args = parser.parse_args()
+    setup_logging(args.log_level, frames=args.log_frames, board=args.log_board)
+
+    ko_rule = 'superko' if args.superko else 'simple'
+    metrics = Metrics()
+    if args.stats_file:
+        metrics.start_file_export(args.stats_file)
+    if args.stats_socket:
+        metrics.start_socket_export(args.stats_socket)
+
+    channels = args.channel or ['can0']
+    addressing = Addressing(args.size, args.size, len(channels), args.addressing)
+    game = Emogo(args.size, args.size, use_asyncio=args.asyncio, ko_rule=ko_rule, channel=channels,
+                 metrics=metrics, addressing=addressing, scoring=args.scoring, komi=args.komi,
+                 live_score=args.live_score, debounce=args.debounce, bulk_resync=args.bulk_resync)
+
+    if args.record:
+        import atexit
+        from emogo_record import FrameRecorder
+        recorder = FrameRecorder(args.record, args.size, args.size, ko_rule, len(channels), addressing.scheme,
+                                 args.debounce, args.bulk_resync)
+        atexit.register(recorder.close)
+        game.can_interface.recorder = recorder
+
+    if args.journal:
+        import atexit
+        from emogo_journal import GameJournal
+        journal = GameJournal(args.journal, args.size, args.size, metrics=metrics)
+        recovered = journal.recover(game)
+        if recovered is not None:
+            logger.info("Resumed the game from %s (%d change(s) after the last snapshot).", args.journal, recovered)
+            game.display_board(game.board)
+            game.resync_board()
+            logger.info("Now it's %s's turn.", game.current_player.capitalize())
+        atexit.register(journal.close)
+        game.game_journal = journal
+
+    if args.sgf:
+        import atexit
+        from emogo_sgf import SGFWriter
+        # 再開した対局は、その時点の盤面を置き石として書く
+        setup = [(stone['color'], stone['x'], stone['y']) for stone in game.board.get_board_state()
+                 if stone['emotion'] != Stone.EMOTION_VALUES['dead']]
+        game.sgf_writer = SGFWriter(args.sgf, args.size, args.size, args.komi, args.scoring, setup,
+                                    game.current_player)
+        atexit.register(game.sgf_writer.close)
+
+    if args.hints:
+        import atexit
+        from emogo_hint import HintEngine
+        game.hint_engine = HintEngine(args.hint_workers, args.hint_deadline, metrics)
+        metrics.add_gauge('hint', game.hint_engine.get_stats)
+        atexit.register(game.hint_engine.shutdown)
+
+    if args.publish:
+        from emogo_shared import BoardPublisher
+        game.publisher = BoardPublisher(args.publish, args.size, args.size)
+        game.publish_state()
+
+    if args.asyncio:
+        # 1つのイベントループで全ての処理を行う（asyncio はこのときだけ読み込む）
+        import asyncio
+        try:
+            asyncio.run(game.run())
+        except KeyboardInterrupt:
+            logger.info("Game terminated.")
+        sys.exit()
+
     game.start_game()
 
     # スクリプトを終了しないように待機
@@ -623,4 +1349,4 @@ if __name__ == "__main__":
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("Game terminated.")
+        logger.info("Game terminated.")
@@ -0,0 +1,327 @@
+import os
+import random
+import threading
+import time
+
+from emogo_log import logger
+
+# 次の一手の候補と、一番弱い連をランダムな対局（プレイアウト）で探すモジュール
+# 盤面の色だけを写した軽い盤で、取れる石はすぐに取り上げて終局まで打ち、勝ち負けと石が残ったかを数える
+# プレイアウトはコアごとのプロセス（ProcessPoolExecutor）で締め切りまで回し、結果を合計する
+# 着手の勝率は、その手をプレイアウトの中で最初に打った場合の勝率（all-moves-as-first）で数える
+# ワーカーのプロセスで読み込まれるので、CAN のモジュールは読み込まない
+
+EMPTY = 0
+BLACK = 0x01  # Stone.COLOR_VALUES と同じ値
+WHITE = 0x02
+BORDER = 0x03  # Board.BORDER と同じ値
+# 交点の値 -> プレイアウトの盤の色（死に石は取り除かれるので空点にする）
+COLORS = bytes(
+    BORDER if value & 0x03 == BORDER else value & 0x03 if value & 0x0C else EMPTY
+    for value in range(256)
+)
+
+class Position:
+    # ヒントを求める局面（Board から色だけを写したもの）
+    def __init__(self, board, player, komi, position_hash=None):
+        self.n = board.n
+        self.m = board.m
+        self.width = board.width
+        self.colors = board.points.translate(COLORS)
+        self.player = player  # 次に打つ色（BLACK / WHITE）
+        self.komi = komi
+        self.position_hash = board.position_hash if position_hash is None else position_hash
+
+class Hint:
+    # ヒントの結果
+    def __init__(self, position, moves, playouts, survival, elapsed):
+        self.position = position
+        self.moves = moves  # 勝率の高い順の [(交点, 勝率, 回数), ...]
+        self.playouts = playouts
+        self.survival = survival  # 交点 -> その石がプレイアウトの最後まで残った割合
+        self.elapsed = elapsed
+
+    # 一番弱い連を返すメソッド（chains は交点のリストのリスト、(連, 残った割合) または None を返す）
+    def weakest(self, chains):
+        result = None
+        for chain in chains:
+            rates = [self.survival[p] for p in chain if p in self.survival]
+            if not rates:
+                continue
+            rate = sum(rates) / len(rates)
+            if result is None or rate < result[1]:
+                result = (chain, rate)
+        return result
+
+class PlayoutBoard:
+    # プレイアウト用の盤（Board と同じく枠付きの1次元の配列で、値は色だけ）
+    def __init__(self, width, colors):
+        self.colors = bytearray(colors)
+        self.offsets = (-width, width, -1, 1)
+        self.diagonals = (-width - 1, -width + 1, width - 1, width + 1)
+        self.empties = [p for p, color in enumerate(self.colors) if color == EMPTY]
+        self.ko = None  # 直前にコウで取られた交点（次の手ではそこに打てない）
+
+    # 交点 p の石の連に呼吸点があるか判定するメソッド
+    def has_liberty(self, p):
+        colors = self.colors
+        offsets = self.offsets
+        color = colors[p]
+        stack = [p]
+        seen = {p}
+        while stack:
+            q = stack.pop()
+            for offset in offsets:
+                r = q + offset
+                value = colors[r]
+                if value == EMPTY:
+                    return True
+                if value == color and r not in seen:
+                    seen.add(r)
+                    stack.append(r)
+        return False
+
+    # 交点 p の石の連を取り上げるメソッド（取り上げた交点のリストを返す）
+    def capture(self, p):
+        colors = self.colors
+        offsets = self.offsets
+        color = colors[p]
+        colors[p] = EMPTY
+        stack = [p]
+        captured = [p]
+        while stack:
+            q = stack.pop()
+            for offset in offsets:
+                r = q + offset
+                if colors[r] == color:
+                    colors[r] = EMPTY
+                    stack.append(r)
+                    captured.append(r)
+        return captured
+
+    # 交点 p が color の眼か判定するメソッド（眼は自分で埋めない）
+    def is_eye(self, p, color):
+        colors = self.colors
+        for offset in self.offsets:
+            value = colors[p + offset]
+            if value != color and value != BORDER:
+                return False
+        opponents = 0
+        edge = False
+        for offset in self.diagonals:
+            value = colors[p + offset]
+            if value == BORDER:
+                edge = True
+            elif value != color and value != EMPTY:
+                opponents += 1
+        return opponents == 0 if edge else opponents <= 1
+
+    # 石を置くメソッド（置けない手なら False を返す）
+    def play(self, p, color):
+        if p == self.ko:
+            return False
+        colors = self.colors
+        colors[p] = color
+        opponent = color ^ 0x03
+        captured = []
+        for offset in self.offsets:
+            q = p + offset
+            if colors[q] == opponent and not self.has_liberty(q):
+                captured.extend(self.capture(q))
+        if not captured and not self.has_liberty(p):
+            colors[p] = EMPTY  # 自殺手
+            return False
+        self.ko = None
+        if len(captured) == 1:
+            # 1子を取って、置いた石が1子で呼吸点が1つだけならコウ
+            neighbors = [colors[p + offset] for offset in self.offsets]
+            if color not in neighbors and neighbors.count(EMPTY) == 1:
+                self.ko = captured[0]
+        self.empties.extend(captured)
+        return True
+
+    # color の手番でランダムに1手打つメソッド（打った交点、またはパスなら None を返す）
+    def play_random(self, color, rnd):
+        empties = self.empties
+        k = len(empties)
+        while k:
+            i = int(rnd() * k)
+            p = empties[i]
+            k -= 1
+            empties[i], empties[k] = empties[k], p
+            if self.is_eye(p, color) or not self.play(p, color):
+                continue
+            empties[k] = empties[-1]
+            empties.pop()
+            return p
+        return None
+
+    # 黒から見た得点（石と、1色の石にだけ接する空点の数の差）を数えるメソッド
+    def score(self):
+        colors = self.colors
+        offsets = self.offsets
+        counts = [0, 0, 0, 0]
+        for p, color in enumerate(colors):
+            if color == EMPTY:
+                owner = 0
+                for offset in offsets:
+                    value = colors[p + offset]
+                    if value != BORDER:
+                        owner |= value
+                counts[owner] += 1  # 両方の色に接する空点は counts[BORDER] に入る（数えない）
+            else:
+                counts[color] += 1
+        return counts[BLACK] - counts[WHITE]
+
+# 締め切りまでプレイアウトを繰り返すメソッド（ワーカーのプロセスで実行する）
+# 戻り値は (プレイアウトの数, 交点ごとの勝ち数, 交点ごとの回数, 交点ごとに石が残った回数)
+def run_playouts(width, colors, player, komi, stop_at, seed):
+    rnd = random.Random(seed).random
+    size = len(colors)
+    wins = [0] * size
+    visits = [0] * size
+    survived = [0] * size
+    stones = [p for p, color in enumerate(colors) if color in (BLACK, WHITE)]
+    max_moves = size * 2
+    playouts = 0
+    while time.monotonic() < stop_at:
+        board = PlayoutBoard(width, colors)
+        first = {}  # 交点 -> 最初にそこに打った色
+        color = player
+        passes = 0
+        moves = 0
+        while passes < 2 and moves < max_moves:
+            p = board.play_random(color, rnd)
+            if p is None:
+                passes += 1
+            else:
+                passes = 0
+                if p not in first:
+                    first[p] = color
+            color ^= 0x03
+            moves += 1
+        margin = board.score() - komi
+        won = margin > 0 if player == BLACK else margin < 0
+        for p, color in first.items():
+            if color == player:
+                visits[p] += 1
+                if won:
+                    wins[p] += 1
+        final = board.colors
+        for p in stones:
+            if final[p] == colors[p]:
+                survived[p] += 1
+        playouts += 1
+    return playouts, wins, visits, survived
+
+# ワーカーのプロセスを起動しておくためのメソッド
+def ready():
+    return os.getpid()
+
+class HintEngine:
+    # ヒントを探すエンジン（プロセスのプールと、結果を待つスレッドを持つ）
+    # 探し始めてから deadline 秒以内に、それまでに終わったプレイアウトの結果で答える
+    # 要求は受信スレッドから呼ばれても待たせず、探している間に来た要求は要求元（碁盤）ごとに最後の1つだけを残す
+    # 残した要求は、来た順に1つずつ探す（他の碁盤の要求を捨てない）
+    MARGIN = 0.05  # 結果を受け取って集計する時間（秒）
+    MIN_VISITS = 4  # 勝率を候補として扱うのに必要な回数
+
+    def __init__(self, workers=None, deadline=0.5, metrics=None):
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        self.workers = workers or os.cpu_count() or 1
+        self.deadline = deadline
+        self.metrics = metrics
+        # 受信などのスレッドがあるプロセスから fork しないように、forkserver で起動する
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('forkserver'))
+        self.condition = threading.Condition()
+        self.requests = {}  # 要求元 -> 待っている要求 (Position, callback, 要求した時刻)（来た順）
+        self.busy = False
+        self.seed = random.getrandbits(32)
+        self.stats = {'requests': 0, 'replaced': 0, 'answered': 0, 'late_workers': 0}
+        # 最初の要求で待たないように、ワーカーを起動しておく
+        for future in [self.executor.submit(ready) for _ in range(self.workers)]:
+            future.result()
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True  # Daemon thread
+        thread.start()
+
+    # ヒントを要求するメソッド（すぐに戻り、結果は callback(Hint) で別のスレッドから渡す）
+    # 同じ key（要求元）の待っている要求は新しい要求で置き換える
+    def submit(self, position, callback, key=None):
+        with self.condition:
+            self.stats['requests'] += 1
+            if key in self.requests:
+                self.stats['replaced'] += 1  # 順番はそのままで、新しい局面を探す
+            self.requests[key] = (position, callback, time.monotonic())
+            self.condition.notify_all()
+
+    # 要求を順に処理するメソッド（スレッド）
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.requests:
+                    self.condition.wait()
+                key = next(iter(self.requests))
+                position, callback, requested = self.requests.pop(key)
+                self.busy = True
+            try:
+                callback(self.search(position, requested))
+            except Exception as e:
+                logger.error("Error looking for a hint: %s", e)
+            finally:
+                with self.condition:
+                    self.busy = False
+
+    # プレイアウトをワーカーに分けて実行し、結果を集計するメソッド
+    def search(self, position, requested):
+        from concurrent.futures import wait
+        start = time.perf_counter_ns()
+        # 他の碁盤の要求を待っていた場合も、探す時間は deadline 秒とる
+        answer_at = time.monotonic() + self.deadline
+        stop_at = answer_at - min(self.MARGIN, self.deadline / 4)
+        colors = bytes(position.colors)
+        futures = []
+        for worker in range(self.workers):
+            self.seed += 1
+            futures.append(self.executor.submit(run_playouts, position.width, colors, position.player,
+                                                position.komi, stop_at, self.seed))
+        done, not_done = wait(futures, timeout=max(0.0, answer_at - time.monotonic()))
+        size = len(colors)
+        playouts = 0
+        wins = [0] * size
+        visits = [0] * size
+        survived = [0] * size
+        for future in done:
+            count, worker_wins, worker_visits, worker_survived = future.result()
+            playouts += count
+            for p in range(size):
+                wins[p] += worker_wins[p]
+                visits[p] += worker_visits[p]
+                survived[p] += worker_survived[p]
+        with self.condition:
+            self.stats['answered'] += 1
+            self.stats['late_workers'] += len(not_done)
+        moves = sorted(((p, wins[p] / visits[p], visits[p]) for p in range(size) if visits[p] >= self.MIN_VISITS),
+                       key=lambda move: -move[1])
+        survival = {}
+        if playouts:
+            survival = {p: survived[p] / playouts for p, color in enumerate(colors) if color in (BLACK, WHITE)}
+        if self.metrics is not None:
+            self.metrics.observe('hint', start)
+            self.metrics.count('hint.playouts', playouts)
+        return Hint(position, moves, playouts, survival, time.monotonic() - requested)
+
+    # 統計情報を辞書で返すメソッド
+    def get_stats(self):
+        with self.condition:
+            stats = dict(self.stats)
+            stats['busy'] = self.busy
+            stats['pending'] = len(self.requests)
+            stats['workers'] = self.workers
+        return stats
+
+    # ワーカーのプロセスを終了するメソッド（探している途中のプレイアウトは締め切りまでに終わる）
+    # 待たずに戻ると、終了時の後始末がすでに閉じたパイプに書き込むことがある
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,327 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+from emogo import Addressing, AnimationScheduler, CANInterface, Emogo
+from emogo_log import board_logger, logger, setup_logging
+from emogo_metrics import Metrics
+from emogo_score import Scorer
+from emogo_sgf import SGFWriter
+from emogo_shared import BoardPublisher
+
+# 1つのプロセスで複数の碁盤（対局）を動かすモジュール
+# 全ての碁盤で受信・送信のスレッドと送信キューを共有し、入力と演出のタイマーも1つのスレッドで実行する
+# 対局の状態は碁盤ごとの Emogo にあり、碁盤の処理は1つのロックの中で順番に行うので、碁盤どうしは影響しない
+# 碁盤ごとに増えるのは Board・Emogo・タイマーだけで、スレッドは碁盤の数によらず一定
+# 使い方: python3 emogo_host.py --channel can0 --channel can1 --tables 2 --size 9（碁盤ごとに1本のバス）
+#         1本のバスを複数の碁盤で共有できるのは仮想バスだけ（例: --bustype virtual --channel sim --tables 12）
+#   キーボード: "<碁盤の番号> <コマンド>"（例: "3 pass"、"3 undo"）、"<碁盤の番号> new" で新しい対局を始める
+#               "tables" で全ての碁盤の状況を表示し、"quit" で終了する
+
+current = threading.local()  # 処理中の碁盤の番号（ログに付ける）
+
+class TableFilter(logging.Filter):
+    # 処理中の碁盤の番号をログの先頭に付けるフィルタ
+    def filter(self, record):
+        table = getattr(current, 'table', None)
+        if table is not None:
+            record.msg = f"[table {table}] {record.msg}"
+        return True
+
+class TablePort(CANInterface):
+    # 1つの碁盤から見た CANInterface（フレームは GameHost の共有の CANInterface で送受信する）
+    # bus_map は碁盤のバス番号 -> 共有のバス番号
+    def __init__(self, host_interface, addressing, bus_map):
+        self.emogo = None
+        self.host_interface = host_interface
+        self.addressing = addressing
+        self.bus_map = list(bus_map)
+        self.buses = [host_interface.buses[bus] for bus in self.bus_map]
+        self.bus = self.buses[0]
+        self.metrics = host_interface.metrics
+        self.recent_frames = host_interface.recent_frames
+        self.recorder = None
+        self.tx_events = None
+
+    # 共有の送信キューにフレームを入れるメソッド
+    def send_message(self, can_id, data, priority=CANInterface.PRIORITY_STATE, bus=0, slot=None):
+        self.host_interface.send_message(can_id, data, priority, self.bus_map[bus], slot)
+
+    def get_tx_stats(self):
+        return self.host_interface.get_tx_stats()
+
+    def shutdown(self):
+        pass  # バスは GameHost が閉じる
+
+class HostInterface(CANInterface):
+    # 受信したフレームを、(バス番号, CAN ID) から碁盤に振り分ける CANInterface
+    def __init__(self, channels, bustype, condition, metrics):
+        self.condition = condition  # 全ての碁盤の処理で共有するロック
+        self.routes = {}  # (共有のバス番号, CAN ID) -> (碁盤の番号, TablePort, 碁盤のバス番号)
+        # 石の位置は碁盤ごとの Addressing で求めるので、ここでの addressing はバスの数を合わせるだけ
+        super().__init__(channels, bustype, metrics=metrics,
+                         addressing=Addressing(len(channels), 1, len(channels)))
+
+    # メッセージを碁盤に振り分けるメソッド
+    def process_message(self, can_id, data, bus=0):
+        route = self.routes.get((bus, can_id))
+        if route is None:
+            logger.warning("Unknown CAN ID: 0x%X on bus %d", can_id, bus)
+            return
+        number, port, table_bus = route
+        with self.condition:
+            current.table = number
+            try:
+                port.process_message(can_id, data, table_bus)
+            finally:
+                current.table = None
+
+class Table:
+    # 1つの碁盤の設定と、その上の対局
+    def __init__(self, number, size_n, size_m, port, options):
+        self.number = number
+        self.size_n = size_n
+        self.size_m = size_m
+        self.port = port
+        self.options = options  # 新しい対局を始めるときに Emogo に渡す引数
+        self.game = None
+        self.publisher = None  # 盤面の状態の公開先（対局が変わっても同じファイルを使う）
+        self.game_record = None  # 対局中の棋譜の SGFWriter（対局ごとに新しいファイルにする）
+
+class GameHost:
+    # publish_dir を指定すると、碁盤ごとの盤面の状態を <publish_dir>/table-<番号> に公開する
+    # hint_engine を渡すと、全ての碁盤でヒントを使えるようにする（ワーカーのプロセスは碁盤で共有する）
+    # sgf_dir を指定すると、対局ごとの棋譜を <sgf_dir>/table-<番号>-<開始時刻>.sgf に書き出す
+    def __init__(self, channels, bustype='socketcan', metrics=None, publish_dir=None, hint_engine=None,
+                 sgf_dir=None):
+        self.condition = threading.Condition()
+        self.bustype = bustype
+        self.stopped = False  # shutdown で True にし、タイマーのスレッドを終了させる
+        self.publish_dir = publish_dir
+        self.sgf_dir = sgf_dir
+        self.hint_engine = hint_engine
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.interface = HostInterface(channels, bustype, self.condition, self.metrics)
+        self.tables = {}  # 碁盤の番号 -> Table
+        self.bus_tables = [[] for _ in channels]  # 共有のバスごとの碁盤の番号
+        self.metrics.add_gauge('tables', self.get_table_stats)
+        self.thread = threading.Thread(target=self.run_timers)
+        self.thread.daemon = True  # Daemon thread
+        self.thread.start()
+
+    # 碁盤を追加して対局を始めるメソッド（碁盤の番号を返す）
+    # buses は碁盤の行を割り当てる共有のバス番号のリスト
+    # 他の碁盤とバスを共有するには、碁盤の番号を CAN ID に入れる 'extended' の形式を指定する
+    # 碁盤のマイコンは標準 ID しか受信しないので、'extended' の形式は仮想バス（virtual）でしか使えない
+    def add_table(self, size_n, size_m, buses=(0,), scheme=None, **options):
+        buses = list(buses)
+        with self.condition:
+            number = len(self.tables)
+            for bus in buses:
+                if not 0 <= bus < len(self.bus_tables):
+                    raise IndexError(f"Bus {bus} does not exist")
+            shared = [bus for bus in buses if self.bus_tables[bus]]
+            if shared and scheme != 'extended':
+                raise ValueError(f"Bus {shared[0]} is already used by table {self.bus_tables[shared[0]][0]}; "
+                                 f"sharing a bus needs the 'extended' addressing scheme")
+            if scheme == 'extended' and self.bustype != 'virtual':
+                raise ValueError("The board firmware only receives standard CAN IDs, so tables can only share a bus "
+                                 "on virtual buses")
+            addressing = Addressing(size_n, size_m, len(buses), scheme, number if scheme == 'extended' else None)
+            port = TablePort(self.interface, addressing, buses)
+            routes = {}
+            for (table_bus, can_id) in addressing.positions:
+                routes[(buses[table_bus], can_id)] = (number, port, table_bus)
+            for table_bus, bus in enumerate(buses):
+                routes[(bus, addressing.control_id)] = (number, port, table_bus)
+            if any(key in self.interface.routes for key in routes):
+                raise ValueError(f"Table {number} would share CAN IDs with another table")
+            table = Table(number, size_n, size_m, port, options)
+            if self.publish_dir is not None:
+                table.publisher = BoardPublisher(os.path.join(self.publish_dir, f"table-{number}"), size_n, size_m)
+            self.tables[number] = table
+            for bus in buses:
+                self.bus_tables[bus].append(number)
+            self.new_game(number)
+            self.interface.routes.update(routes)
+        return number
+
+    # 碁盤で新しい対局を始めるメソッド（前の対局の状態とタイマーは捨てる）
+    def new_game(self, number):
+        table = self.tables.get(number)
+        if table is None:
+            raise IndexError(f"Table {number} does not exist")
+        with self.condition:
+            animations = AnimationScheduler(table.port, threaded=False, condition=self.condition)
+            table.game = Emogo(table.size_n, table.size_m, use_keyboard=False, metrics=self.metrics,
+                               can_interface=table.port, animations=animations, **table.options)
+            # Emogo は自分の入力の統計を登録するので、全ての碁盤の合計に置き換える
+            self.metrics.add_gauge('input', self.get_input_stats)
+            table.game.publisher = table.publisher
+            table.game.hint_engine = self.hint_engine
+            if table.game_record is not None:
+                table.game_record.close()
+                table.game_record = None
+            if self.sgf_dir is not None:
+                options = table.options
+                path = os.path.join(self.sgf_dir, f"table-{number}-{time.strftime('%Y%m%d-%H%M%S')}.sgf")
+                table.game_record = SGFWriter(path, table.size_n, table.size_m, options.get('komi', 6.5),
+                                              options.get('scoring', 'area'))
+                table.game.sgf_writer = table.game_record
+            table.game.publish_state()
+            current.table = number
+            try:
+                logger.info("Game started! Black goes first.")
+            finally:
+                current.table = None
+
+    # 全ての碁盤の入力と演出のタイマーを実行するメソッド（スレッド）
+    def run_timers(self):
+        with self.condition:
+            while not self.stopped:
+                delay = None
+                for number, table in list(self.tables.items()):
+                    current.table = number
+                    due = table.game.animations.run_due()
+                    if due is not None and (delay is None or due < delay):
+                        delay = due
+                current.table = None
+                self.condition.wait(delay)
+
+    # キーボードからのコマンドを処理するメソッド（"<碁盤の番号> <コマンド>" を碁盤の Emogo に渡す）
+    # quit が入力されたら False を返す
+    def handle_command(self, user_input):
+        words = user_input.split(None, 1)
+        if not words:
+            return True
+        if words[0].lower() == 'quit':
+            logger.info("Host terminated by user.")
+            return False
+        if words[0].lower() == 'tables':
+            for number, stats in self.get_table_stats().items():
+                logger.info("Table %d: %s", number, stats)
+            return True
+        if len(words) < 2 or not words[0].isdigit() or int(words[0]) not in self.tables:
+            logger.info("Type '<table> <command>' (e.g. '0 pass', '0 undo', '0 new'), 'tables' or 'quit'.")
+            return True
+        number = int(words[0])
+        if words[1].lower() == 'new':
+            self.new_game(number)
+            return True
+        with self.condition:
+            current.table = number
+            try:
+                self.tables[number].game.handle_command(words[1])
+            finally:
+                current.table = None
+        return True
+
+    # 碁盤ごとの状況を辞書で返すメソッド
+    def get_table_stats(self):
+        with self.condition:
+            stats = {}
+            for number, table in self.tables.items():
+                game = table.game
+                stats[number] = {
+                    'size': f"{table.size_n}x{table.size_m}",
+                    'buses': table.port.bus_map,
+                    'moves': len(game.position_history) - 1,
+                    'turn': game.current_player,
+                    'game_over': game.game_over,
+                    'input': game.inputs.get_stats()
+                }
+        return stats
+
+    # 全ての碁盤の入力の統計を合計して返すメソッド
+    def get_input_stats(self):
+        with self.condition:
+            stats = {}
+            for table in self.tables.values():
+                if table.game is None:
+                    continue
+                for name, value in table.game.inputs.get_stats().items():
+                    stats[name] = stats.get(name, 0) + value
+        return stats
+
+    # タイマーのスレッドを止め、全ての碁盤の棋譜とバスを閉じるメソッド
+    def shutdown(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+        for table in self.tables.values():
+            table.port.shutdown()
+            if table.game_record is not None:
+                table.game_record.close()
+        self.interface.shutdown()
+        if self.hint_engine is not None:
+            self.hint_engine.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Host several EmoGo tables in one process")
+    parser.add_argument('--channel', action='append', help="CAN channel (repeat to spread the tables over buses)")
+    parser.add_argument('--bustype', default='socketcan', help="python-can interface")
+    parser.add_argument('--tables', type=int, default=1, help="number of tables (spread over the channels in turn)")
+    parser.add_argument('--size', type=int, default=9, help="board size")
+    parser.add_argument('--superko', action='store_true', help="use the positional superko rule instead of simple ko")
+    parser.add_argument('--scoring', default='area', choices=Scorer.RULES, help="scoring rule")
+    parser.add_argument('--komi', type=float, default=6.5, help="points given to white")
+    parser.add_argument('--debounce', type=float, default=0.05,
+                        help="seconds a stone sensor must stay quiet before its event is handled (0 to disable)")
+    parser.add_argument('--bulk-resync', action='store_true',
+                        help="resend a whole board as a few packed broadcast frames instead of one frame per stone "
+                             "(needs one bus per table and the 'nibble' addressing)")
+    parser.add_argument('--publish-dir', help="publish each live board to <dir>/table-<number> (e.g. /dev/shm)")
+    parser.add_argument('--sgf-dir', help="write the record of every game to <dir>/table-<number>-<time>.sgf")
+    parser.add_argument('--hints', action='store_true',
+                        help="suggest a move and show the weakest group when a stone is double-tapped")
+    parser.add_argument('--hint-deadline', type=float, default=0.5, help="seconds to look for a hint")
+    parser.add_argument('--hint-workers', type=int, help="processes running playouts (default: one per core)")
+    parser.add_argument('--stats-file', help="write metrics to this JSON file every second")
+    parser.add_argument('--stats-socket', help="serve metrics on this Unix socket")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="level of the game log")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    logger.addFilter(TableFilter())
+    board_logger.addFilter(TableFilter())
+
+    metrics = Metrics()
+    if args.stats_file:
+        metrics.start_file_export(args.stats_file)
+    if args.stats_socket:
+        metrics.start_socket_export(args.stats_socket)
+
+    channels = args.channel or ['can0']
+    # 1本のバスに複数の碁盤を載せる場合は、全ての碁盤で碁盤の番号入りの CAN ID を使う（仮想バスのみ）
+    scheme = None
+    if args.tables > len(channels):
+        if args.bustype != 'virtual':
+            parser.error("the board firmware only receives standard CAN IDs, so each table needs its own channel")
+        scheme = 'extended'
+    hint_engine = None
+    if args.hints:
+        from emogo_hint import HintEngine
+        hint_engine = HintEngine(args.hint_workers, args.hint_deadline, metrics)
+        metrics.add_gauge('hint', hint_engine.get_stats)
+    host = GameHost(channels, args.bustype, metrics, args.publish_dir, hint_engine, args.sgf_dir)
+    for number in range(args.tables):
+        host.add_table(args.size, args.size, buses=(number % len(channels),), scheme=scheme,
+                       ko_rule='superko' if args.superko else 'simple', scoring=args.scoring, komi=args.komi,
+                       debounce=args.debounce, bulk_resync=args.bulk_resync)
+    logger.info("Hosting %d table(s) on %s.", args.tables, ', '.join(channels))
+
+    try:
+        for line in sys.stdin:
+            if not host.handle_command(line.strip()):
+                break
+    except KeyboardInterrupt:
+        logger.info("Host terminated.")
+    finally:
+        host.shutdown()
+
+if __name__ == "__main__":
+    main()
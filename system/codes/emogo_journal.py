@@ -0,0 +1,232 @@
+import os
+import struct
+import threading
+import time
+import zlib
+
+# 対局の状態の変化を追記していき、プロセスが落ちても対局を再開できるようにするモジュール
+# 着手・パス・石の除去・取り消しごとに、変わった交点とゲームの状態をファイルに追記する
+# 書き込みは書き出しスレッドがまとめて行い（グループコミット）、fsync も1回にまとめるので、受信処理を待たせない
+# 一定数ごとに盤面全体のスナップショットを書き、それより前の記録は捨てる
+# 再開するときはスナップショットを読み、その後の記録を順に当てはめる（ルールの処理はやり直さない）
+# 使い方: python3 emogo.py --journal game.emwal（ファイルがあれば、その対局を再開する）
+#
+# ファイル形式（リトルエンディアン）
+#   記録のファイル: ヘッダ 'EMGW', バージョン (u16), 盤の大きさ n, m (u8), 予約 (8バイト)
+#                   記録: 長さ (u32), CRC32 (u32), 番号 (u64), 状態
+#   スナップショット（記録のファイル名 + '.snap'）: 'EMGK', バージョン (u16), n, m (u8), 最後に含む記録の番号 (u64),
+#                   長さ (u32), CRC32 (u32), 状態（全ての交点と、局面の履歴の全体）
+#   状態: 局面のハッシュ値 (u64), 手番 (u8, 1: 黒, 2: 白), フラグ (u8, 1: 死に石の除去待ち), 連続パス回数 (u8), 予約 (u8),
+#         アゲハマ 黒, 白 (u16), 局面の履歴の長さ (u32), 交点の数, 履歴に追加するハッシュ値の数, 死に石の数 (u16),
+#         交点 (u16) と値 (u8) の組, 追加するハッシュ値 (u64), 死に石の (x, y) (u8, u8)
+
+MAGIC = b'EMGW'
+SNAPSHOT_MAGIC = b'EMGK'
+VERSION = 1
+HEADER = struct.Struct('<4sHBB8x')
+SNAPSHOT_HEADER = struct.Struct('<4sHBBQII')
+RECORD = struct.Struct('<IIQ')
+STATE = struct.Struct('<QBBBxHHIHHH')
+VALUE = struct.Struct('<HB')
+POSITION = struct.Struct('<Q')
+DEAD_STONE = struct.Struct('<BB')
+FLAG_WAITING_FOR_REMOVAL = 0x01
+PLAYERS = {'black': 1, 'white': 2}
+
+# 状態の変化をバイト列にするメソッド
+# values は [(交点, 値), ...]、state は Emogo.game_state() の辞書、positions は局面の履歴に追加するハッシュ値
+def encode_state(values, position_hash, state, positions):
+    parts = [STATE.pack(position_hash, PLAYERS[state['current_player']],
+                        FLAG_WAITING_FOR_REMOVAL if state['waiting_for_dead_stones_removal'] else 0,
+                        state['consecutive_passes'], state['captures']['black'], state['captures']['white'],
+                        state['history_length'], len(values), len(positions), len(state['dead_stones_list']))]
+    parts.extend(VALUE.pack(p, value) for p, value in values)
+    parts.extend(POSITION.pack(position) for position in positions)
+    parts.extend(DEAD_STONE.pack(x, y) for x, y in state['dead_stones_list'])
+    return b''.join(parts)
+
+# バイト列から状態の変化 (values, position_hash, state, positions) を取り出すメソッド
+def decode_state(payload):
+    (position_hash, player, flags, consecutive_passes, black_captures, white_captures, history_length,
+     value_count, position_count, dead_count) = STATE.unpack_from(payload)
+    offset = STATE.size
+    values = list(VALUE.iter_unpack(payload[offset:offset + value_count * VALUE.size]))
+    offset += value_count * VALUE.size
+    positions = [position for position, in POSITION.iter_unpack(payload[offset:offset + position_count * POSITION.size])]
+    offset += position_count * POSITION.size
+    dead_stones = list(DEAD_STONE.iter_unpack(payload[offset:offset + dead_count * DEAD_STONE.size]))
+    state = {
+        'current_player': 'black' if player == PLAYERS['black'] else 'white',
+        'consecutive_passes': consecutive_passes,
+        'waiting_for_dead_stones_removal': bool(flags & FLAG_WAITING_FOR_REMOVAL),
+        'dead_stones_list': dead_stones,
+        'captures': {'black': black_captures, 'white': white_captures},
+        'history_length': history_length
+    }
+    return values, position_hash, state, positions
+
+class GameJournal:
+    # commit_interval 秒ごとに、溜まった記録をまとめて書き込んで fsync する
+    # snapshot_every 件ごとに盤面全体のスナップショットを書き、記録のファイルを空にする
+    def __init__(self, path, board_size_n, board_size_m, commit_interval=0.05, snapshot_every=100, metrics=None):
+        self.path = path
+        self.snapshot_path = path + '.snap'
+        self.n = board_size_n
+        self.m = board_size_m
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.metrics = metrics
+        self.header = HEADER.pack(MAGIC, VERSION, board_size_n, board_size_m)
+        self.condition = threading.Condition()
+        self.commit_lock = threading.Lock()  # 書き込みは1つずつ、記録の順に行う
+        self.pending = []  # 書き出し待ちの (記録, スナップショット)（どちらかは None）
+        self.sequence = 0  # 最後に書いた記録の番号
+        self.since_snapshot = 0
+        self.closed = False
+        self.file = None
+        self.thread = None
+
+    # 記録とスナップショットのファイルから対局を再開するメソッド（当てはめた記録の数を返す。ファイルがなければ None）
+    # 再開した後は、記録の書き込みを開始する
+    def recover(self, emogo):
+        recovered = None
+        snapshot_sequence = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+            magic, version, n, m, snapshot_sequence, length, crc = SNAPSHOT_HEADER.unpack_from(data)
+            payload = data[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length]
+            if magic != SNAPSHOT_MAGIC or version != VERSION or (n, m) != (self.n, self.m):
+                raise ValueError(f"{self.snapshot_path} is not a snapshot of a {self.n}x{self.m} game")
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                raise ValueError(f"{self.snapshot_path} is corrupted")
+            self.apply(emogo, decode_state(payload))
+            self.sequence = snapshot_sequence
+            recovered = 0
+        valid_length = HEADER.size
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            if data[:HEADER.size] != self.header:
+                raise ValueError(f"{self.path} is not a journal of a {self.n}x{self.m} game")
+            offset = HEADER.size
+            recovered = recovered or 0
+            while offset + RECORD.size <= len(data):
+                length, crc, sequence = RECORD.unpack_from(data, offset)
+                payload = data[offset + RECORD.size:offset + RECORD.size + length]
+                if len(payload) != length or zlib.crc32(payload) != crc:
+                    break  # 書きかけの記録（ここから後は捨てる）
+                offset += RECORD.size + length
+                valid_length = offset
+                if sequence <= snapshot_sequence:
+                    continue  # スナップショットに含まれている
+                self.apply(emogo, decode_state(payload))
+                self.sequence = sequence
+                recovered += 1
+        if recovered is not None:
+            emogo.game_over = emogo.consecutive_passes >= 2
+        self.start(valid_length)
+        return recovered
+
+    # 状態の変化を Emogo に当てはめるメソッド
+    def apply(self, emogo, change):
+        values, position_hash, state, positions = change
+        emogo.board.apply_change(values, position_hash)
+        emogo.set_game_state(state, positions)
+
+    # 記録のファイルを開き、書き出しスレッドを開始するメソッド（valid_length より後の書きかけの記録は捨てる）
+    def start(self, valid_length=HEADER.size):
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= HEADER.size:
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(valid_length)
+            self.file.seek(valid_length)
+        else:
+            self.file = open(self.path, 'wb')
+            self.file.write(self.header)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.thread = threading.Thread(target=self.commit_periodically)
+        self.thread.daemon = True  # Daemon thread
+        self.thread.start()
+
+    # 状態の変化を記録するメソッド（書き込みは書き出しスレッドで行う）
+    def log(self, emogo, values, position_hash, state, positions=()):
+        payload = encode_state(values, position_hash, state, positions)
+        with self.condition:
+            self.sequence += 1
+            record = RECORD.pack(len(payload), zlib.crc32(payload), self.sequence) + payload
+            self.pending.append((record, None))
+            self.since_snapshot += 1
+            if self.since_snapshot >= self.snapshot_every:
+                self.snapshot(emogo)
+
+    # 盤面全体のスナップショットを取り、書き出しを予約するメソッド
+    def snapshot(self, emogo):
+        board = emogo.board
+        values = [(p, board.points[p]) for p in range(len(board.points)) if board.points[p] != board.BORDER]
+        state = emogo.game_state()
+        payload = encode_state(values, board.position_hash, state, emogo.position_history)
+        with self.condition:
+            header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, VERSION, self.n, self.m, self.sequence, len(payload),
+                                          zlib.crc32(payload))
+            self.pending.append((None, header + payload))
+            self.since_snapshot = 0
+
+    # 溜まった記録をまとめて書き込むメソッド（書き出しスレッド）
+    def commit_periodically(self):
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                self.condition.wait(self.commit_interval)
+            self.commit()
+
+    # 溜まった記録を書き込み、fsync するメソッド
+    def commit(self):
+        with self.commit_lock:
+            with self.condition:
+                pending = self.pending
+                self.pending = []
+            if not pending or self.file is None:
+                return
+            start = time.perf_counter_ns()
+            for record, snapshot in pending:
+                if record is not None:
+                    self.file.write(record)
+                else:
+                    # スナップショットより前の記録を書き終えてから、スナップショットを置き換え、記録のファイルを空にする
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.write_snapshot(snapshot)
+                    self.file.truncate(HEADER.size)
+                    self.file.seek(HEADER.size)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        if self.metrics is not None:
+            self.metrics.observe('journal.commit', start)
+            self.metrics.count('journal.records', sum(record is not None for record, _ in pending))
+
+    # スナップショットを一時ファイルに書いてから置き換えるメソッド
+    def write_snapshot(self, snapshot):
+        temporary = f"{self.snapshot_path}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.snapshot_path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    # 残りの記録を書き込んで閉じるメソッド
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.commit()
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,63 @@
+import atexit
+import collections
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+# ログをキューに入れ、整形と書き出しはバックグラウンドのスレッドで行うモジュール
+# 受信・送信スレッドは標準出力への書き込みを待たない
+
+logger = logging.getLogger('emogo')               # 対局の進行とエラー
+frame_logger = logging.getLogger('emogo.frames')  # 送受信したフレームのダンプ（DEBUG）
+board_logger = logging.getLogger('emogo.board')   # 碁盤の表示（DEBUG）
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # メッセージの整形も書き出しスレッドで行うハンドラ
+    # そのため引数には後から変更されないもの（bytes や数値）を渡すこと
+    def prepare(self, record):
+        return record
+
+class Lazy:
+    # 文字列に変換されるときに初めて関数を呼ぶオブジェクト（書き出しスレッドで呼ばれる）
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return self.function(*self.args)
+
+# フレームを candump 形式の文字列にするメソッド
+def format_frame(can_id, data):
+    return f"{can_id:03X}#{data.hex(' ').upper()}"
+
+class FrameRing:
+    # 直近に送受信したフレームを保持するリングバッファ（不具合の調査用）
+    def __init__(self, size=256):
+        self.frames = collections.deque(maxlen=size)
+
+    # フレームを記録するメソッド（direction は 'RX' または 'TX'）
+    def record(self, direction, can_id, data):
+        self.frames.append((time.time(), direction, can_id, bytes(data)))
+
+    # 記録したフレームを古い順に文字列で返すメソッド
+    def dump(self):
+        return [f"{timestamp:.6f} {direction} {format_frame(can_id, data)}"
+                for timestamp, direction, can_id, data in list(self.frames)]
+
+# ログの出力先を設定し、書き出しスレッドを開始するメソッド
+# frames と board を有効にしない限り、フレームのダンプと碁盤の表示は作成されない
+def setup_logging(level=logging.INFO, frames=False, board=False, stream=None):
+    handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    frame_logger.setLevel(logging.DEBUG if frames else logging.WARNING)
+    board_logger.setLevel(logging.DEBUG if board else logging.WARNING)
+    listener.start()
+    atexit.register(listener.stop)  # 終了時に残りのログを書き出す
+    return listener
@@ -0,0 +1,141 @@
+import json
+import os
+import socket
+import threading
+import time
+
+# 処理時間のヒストグラムとカウンタを集計し、ファイルや Unix ソケットで公開するモジュール
+# 記録は整数演算だけで行うので、受信・送信スレッドの負担にならない
+# 受信・送信・タイマー・ヒントのスレッドから同時に呼ばれるので、更新はロックの中で行う
+
+class Histogram:
+    # 対数目盛りのヒストグラム（ナノ秒単位、1オクターブを8分割するので誤差は約6%以内）
+    SUB_BUCKETS = 8
+
+    def __init__(self):
+        self.buckets = [0] * (65 * self.SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    # 値を記録するメソッド
+    def record(self, value):
+        bits = value.bit_length()
+        if bits > 4:
+            index = bits * self.SUB_BUCKETS + ((value >> (bits - 4)) & 0x07)
+        else:
+            index = value  # 16ns 未満はそのまま
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    # バケットの代表値（中央の値）を求めるメソッド
+    def bucket_value(self, index):
+        bits, sub = divmod(index, self.SUB_BUCKETS)
+        if bits <= 4:
+            return index
+        low = (self.SUB_BUCKETS + sub) << (bits - 4)
+        return low + (1 << (bits - 4)) // 2
+
+    # パーセンタイルを求めるメソッド（0 < q <= 1）
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = max(1, int(self.count * q + 0.5))
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    # 集計結果を辞書で返すメソッド（単位はマイクロ秒）
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1000 if self.count else 0,
+            'p50_us': self.percentile(0.50) / 1000,
+            'p99_us': self.percentile(0.99) / 1000,
+            'max_us': self.max / 1000
+        }
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}  # 名前 -> 値を返す関数（スナップショットを作るときに呼ぶ）
+        self.started = time.time()
+        self.lock = threading.Lock()  # ヒストグラムとカウンタの更新・読み出し
+
+    # 処理時間を記録するメソッド（start は time.perf_counter_ns() の値）
+    def observe(self, name, start):
+        elapsed = time.perf_counter_ns() - start
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(elapsed)
+
+    # カウンタを増やすメソッド
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # ゲージ（キューの長さなど、その時点の値）を登録するメソッド
+    def add_gauge(self, name, function):
+        self.gauges[name] = function
+
+    # 現在の集計結果を辞書で返すメソッド
+    def snapshot(self):
+        gauges = {}
+        for name, function in list(self.gauges.items()):
+            try:
+                gauges[name] = function()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        with self.lock:
+            spans = {name: histogram.summary() for name, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        return {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'spans': spans,
+            'counters': counters,
+            'gauges': gauges
+        }
+
+    # 集計結果を一定間隔でファイルに書き出すスレッドを開始するメソッド
+    # 読み手が書きかけのファイルを読まないように、一時ファイルに書いてから置き換える
+    def start_file_export(self, path, interval=1.0):
+        def export():
+            while True:
+                temporary = f"{path}.tmp"
+                with open(temporary, 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(temporary, path)
+                time.sleep(interval)
+        thread = threading.Thread(target=export)
+        thread.daemon = True  # Daemon thread
+        thread.start()
+
+    # Unix ソケットに接続されたら集計結果を返すスレッドを開始するメソッド
+    # 例: socat - UNIX-CONNECT:/tmp/emogo.sock
+    def start_socket_export(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        def serve():
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    try:
+                        connection.sendall(json.dumps(self.snapshot()).encode() + b'\n')
+                    except OSError:
+                        pass
+        thread = threading.Thread(target=serve)
+        thread.daemon = True  # Daemon thread
+        thread.start()
@@ -0,0 +1,143 @@
+import numpy as np
+
+from emogo_rules import Board, Stone
+
+# NumPy を使って複数の盤面をまとめて評価するモジュール
+# 解析や自己対戦のツール用で、emogo.py の実行には必要ない
+
+EMPTY = 0
+BLACK = Stone.COLOR_VALUES['black']
+WHITE = Stone.COLOR_VALUES['white']
+
+class BatchBoard:
+    # 複数の盤面を (B, n, m) の配列で保持し、連・呼吸点・死に石・感情を一括で計算するクラス
+    # 結果は1つずつ Board に石を置いた場合と同じになる
+    def __init__(self, colors, dead=None):
+        self.colors = np.array(colors, dtype=np.int8)  # 0: 石なし, 1: 黒, 2: 白
+        if self.colors.ndim != 3:
+            raise ValueError("colors must have shape (B, n, m)")
+        self.batch, self.n, self.m = self.colors.shape
+        if dead is None:
+            dead = np.zeros(self.colors.shape, dtype=bool)
+        self.dead = np.array(dead, dtype=bool) & (self.colors != EMPTY)  # 取り除かれるのを待っている死に石
+        self.labels = None     # 連の番号（石がない交点は -1）
+        self.liberties = None  # 交点の石が属する連の呼吸点の数
+        self.emotions = None   # 感情（石がない交点は -1）
+
+    # Board のリストから作成するメソッド（盤面の大きさは全て同じであること）
+    @classmethod
+    def from_boards(cls, boards):
+        values = np.stack([
+            np.frombuffer(bytes(board.points), dtype=np.uint8).reshape(board.n + 2, board.m + 2)[1:-1, 1:-1]
+            for board in boards
+        ])
+        colors = (values & Board.COLOR_MASK).astype(np.int8)
+        dead = (colors != EMPTY) & ((values & Board.EMOTION_MASK) == 0)
+        batch = cls(colors, dead)
+        batch.emotions = np.where(colors != EMPTY, (values & Board.EMOTION_MASK) >> Board.EMOTION_SHIFT, -1)
+        return batch
+
+    # 上下左右の隣接点の値を返すメソッド（盤外は fill で埋める）
+    @staticmethod
+    def shifted(array, fill):
+        padded = np.pad(array, ((0, 0), (1, 1), (1, 1)), constant_values=fill)
+        return (padded[:, :-2, 1:-1], padded[:, 2:, 1:-1], padded[:, 1:-1, :-2], padded[:, 1:-1, 2:])
+
+    # 同じ色で繋がった石に、連の中で最も小さい交点の番号を付けるメソッド
+    def label_chains(self):
+        size = self.colors.size
+        stones = self.colors != EMPTY
+        labels = np.where(stones, np.arange(size).reshape(self.colors.shape), size)
+        neighbor_colors = self.shifted(self.colors, -1)
+        while True:
+            # 同じ色の隣接点の番号の最小値を伝播させる
+            new_labels = labels
+            for neighbor_color, neighbor_label in zip(neighbor_colors, self.shifted(labels, size)):
+                same = stones & (neighbor_color == self.colors)
+                new_labels = np.where(same, np.minimum(new_labels, neighbor_label), new_labels)
+            # ポインタジャンプで収束を速める（番号は常に同じ連の交点を指す）
+            flat = new_labels.reshape(-1)
+            new_labels = np.where(stones, flat[np.minimum(flat, size - 1)].reshape(labels.shape), size)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+        return np.where(stones, labels, -1)
+
+    # 各交点の石が属する連の呼吸点の数を数えるメソッド
+    # 呼吸点は空点、または相手の死に石（同じ交点は1回だけ数える）
+    def count_liberties(self, labels, dead):
+        size = self.colors.size
+        liberty_points = (self.colors == EMPTY) | dead
+        counted = []
+        counts = np.zeros(size, dtype=np.int64)
+        for neighbor_color, neighbor_label in zip(self.shifted(self.colors, -1), self.shifted(labels, -1)):
+            valid = liberty_points & (neighbor_label >= 0) & (neighbor_color != self.colors)
+            # 同じ連が複数の方向から隣接している場合は1回だけ数える
+            for other in counted:
+                valid &= neighbor_label != other
+            counts += np.bincount(neighbor_label[valid], minlength=size)
+            counted.append(np.where(valid, neighbor_label, -1))
+        return np.where(labels >= 0, counts[np.maximum(labels, 0)], 0)
+
+    # 呼吸点が0の連を死に石にするメソッド（対象の色を指定する）
+    def capture(self, labels, dead, colors):
+        liberties = self.count_liberties(labels, dead)
+        target = self.colors == colors[:, None, None]
+        return dead | (target & (labels >= 0) & (liberties == 0))
+
+    # アタリ（呼吸点が1つ）の相手の連に隣接する連の石を求めるメソッド
+    def threatening(self, labels, liberties):
+        stones = labels >= 0
+        atari = stones & (liberties == 1)
+        touching = np.zeros(self.colors.shape, dtype=bool)
+        for neighbor_color, neighbor_atari in zip(self.shifted(self.colors, -1), self.shifted(atari, False)):
+            touching |= stones & neighbor_atari & (neighbor_color != self.colors)
+        # 連のどれか1つの石が接していれば、連の全ての石が対象になる
+        chains = np.bincount(labels[touching], minlength=self.colors.size) > 0
+        return stones & chains[np.maximum(labels, 0)]
+
+    # 各盤面に1手ずつ石を置いて評価するメソッド
+    # xs, ys は1始まりの座標（0 の盤面は石を置かない）、colors は置く石の色
+    def place_stones(self, xs, ys, colors):
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        colors = np.asarray(colors, dtype=np.int8)
+        moved = xs > 0
+        index = np.nonzero(moved)[0]
+        if np.any(self.colors[index, xs[moved] - 1, ys[moved] - 1] != EMPTY):
+            raise RuntimeError("Position already has a stone")
+        self.colors[index, xs[moved] - 1, ys[moved] - 1] = colors[moved]
+        self.evaluate(np.where(moved, colors, EMPTY))
+
+    # 連・呼吸点・死に石・感情を計算するメソッド
+    # movers は各盤面で最後に石を置いた色（置いていない盤面は 0）
+    def evaluate(self, movers=None):
+        if movers is None:
+            movers = np.zeros(self.batch, dtype=np.int8)
+        movers = np.asarray(movers, dtype=np.int8)
+        opponents = np.where(movers == BLACK, WHITE, np.where(movers == WHITE, BLACK, EMPTY)).astype(np.int8)
+        labels = self.label_chains()
+        dead = self.dead
+        # 1. 相手の死に石、2. 自分の死に石の順に判定する（取った石の分だけ自分の呼吸点が増えるため）
+        dead = self.capture(labels, dead, opponents)
+        dead = self.capture(labels, dead, movers)
+        # 3. 呼吸点の数から全ての連の感情を決める
+        liberties = self.count_liberties(labels, dead)
+        stones = labels >= 0
+        emotions = np.full(self.colors.shape, Stone.EMOTION_VALUES['normal'], dtype=np.int8)
+        emotions[(liberties >= 2) & self.threatening(labels, liberties)] = Stone.EMOTION_VALUES['offensive']
+        emotions[liberties == 1] = Stone.EMOTION_VALUES['defensive']
+        emotions[liberties == 0] = Stone.EMOTION_VALUES['dead']
+        emotions[~stones] = -1
+        self.labels = labels
+        self.dead = stones & (liberties == 0)
+        self.liberties = liberties
+        self.emotions = emotions
+
+    # 各盤面の死に石以外の石の数を数えるメソッド
+    def stone_counts(self):
+        live = (self.colors != EMPTY) & ~self.dead
+        return {
+            'black': np.count_nonzero(live & (self.colors == BLACK), axis=(1, 2)),
+            'white': np.count_nonzero(live & (self.colors == WHITE), axis=(1, 2))
+        }
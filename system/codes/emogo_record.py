@@ -0,0 +1,257 @@
+import argparse
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from emogo import Addressing, Emogo
+
+# 送受信した CAN フレームをバイナリ形式で記録し、再生するモジュール
+# 使い方:
+#   記録: python3 emogo.py --record game.emlog
+#   表示: python3 emogo_record.py dump game.emlog
+#   再生: python3 emogo_record.py replay game.emlog [--realtime]
+#
+# ファイル形式（リトルエンディアン、24バイト単位なので mmap でそのまま読める）
+#   ヘッダ: 'EMGL', バージョン (u16), 盤の大きさ n, m (u8), コウのルール (u8, Emogo.KO_RULES の番号),
+#           バスの数 (u8, 0 は 1 とみなす), CAN ID の形式 (u8, Addressing.SCHEMES の番号),
+#           入力のチャタリングを待つ時間 (u16, ミリ秒, 0 は待たない), フラグ (u8, 1: まとめたフレームで再送信する)
+#   フレーム: 時刻 (f64, UNIX 時間), 方向 (u8, 0: RX, 1: TX), データ長 (u8), バス番号 (u8), CAN ID (u32), データ (8バイト)
+
+MAGIC = b'EMGL'
+VERSION = 1
+HEADER = struct.Struct('<4sHBBBBBHB10x')
+FLAG_BULK_RESYNC = 0x01
+RECORD = struct.Struct('<dBBBxI8s')
+DIRECTIONS = ('RX', 'TX')
+
+class FrameRecorder:
+    # フレームをファイルに追記するクラス
+    # 書き込みはバッファに溜め、書き出しスレッドが一定間隔でファイルに書き出す
+    def __init__(self, path, board_size_n, board_size_m, ko_rule='simple', buses=1, scheme='nibble', debounce=0.0,
+                 bulk_resync=False, flush_interval=0.5):
+        header = HEADER.pack(MAGIC, VERSION, board_size_n, board_size_m, Emogo.KO_RULES.index(ko_rule),
+                             buses, Addressing.SCHEMES.index(scheme), round(debounce * 1000),
+                             FLAG_BULK_RESYNC if bulk_resync else 0)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # 既存のファイルには同じ盤の設定のときだけ追記する
+            with open(path, 'rb') as f:
+                if f.read(HEADER.size) != header:
+                    raise ValueError(f"{path} was recorded with different game settings")
+            # 前回が書き込みの途中で落ちていたら、書きかけのフレームを捨ててフレームの境界から追記する
+            size = os.path.getsize(path)
+            torn = (size - HEADER.size) % RECORD.size
+            if torn:
+                os.truncate(path, size - torn)
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'ab')
+            self.file.write(header)
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+        thread = threading.Thread(target=self.flush_periodically, args=(flush_interval,))
+        thread.daemon = True  # Daemon thread
+        thread.start()
+
+    # フレームを記録するメソッド（direction は 'RX' または 'TX'）
+    def record(self, direction, can_id, data, bus=0):
+        record = RECORD.pack(time.time(), DIRECTIONS.index(direction), len(data), bus, can_id, bytes(data))
+        with self.lock:
+            self.buffer += record
+
+    # バッファの内容をファイルに書き出すメソッド
+    def flush(self):
+        with self.lock:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+        if data:
+            self.file.write(data)
+            self.file.flush()
+
+    def flush_periodically(self, interval):
+        while not self.file.closed:
+            time.sleep(interval)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class FrameLog:
+    # 記録されたファイルを mmap で読むクラス（フレームは (時刻, 方向, バス番号, CAN ID, データ) のタプル）
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ValueError(f"{path} is not a frame log")
+        (magic, version, self.board_size_n, self.board_size_m, ko_rule, buses, scheme,
+         debounce, flags) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a frame log (version {VERSION})")
+        self.ko_rule = Emogo.KO_RULES[ko_rule]
+        self.buses = max(buses, 1)
+        self.scheme = Addressing.SCHEMES[scheme]
+        self.debounce = debounce / 1000
+        self.bulk_resync = bool(flags & FLAG_BULK_RESYNC)
+        # 書きかけのフレームは読まない
+        self.count = (len(self.map) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(f"Frame {index} is out of range")
+        timestamp, direction, length, bus, can_id, data = RECORD.unpack_from(self.map, HEADER.size + index * RECORD.size)
+        return timestamp, DIRECTIONS[direction], bus, can_id, data[:length]
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        self.map.close()
+
+class FakeClock:
+    # 再生中の時刻を返す時計（記録の時刻に合わせて進める）
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Replayer:
+    # 記録された受信フレームを Emogo に入力し、送信フレームが記録と一致するか確認するクラス
+    # 演出（ハイライト・点滅）のフレームは実際の時刻に左右されるので、既定では比較しない
+    # バスが複数ある場合、バスをまたいだ送信の順番は決まらないので、バスごとの順番で比較する
+    ANIMATION_COMMANDS = (0x02, 0x03)
+
+    replay_ids = itertools.count()
+
+    def __init__(self, log, compare_animations=False):
+        self.log = log
+        self.compare_animations = compare_animations
+        self.clock = FakeClock()
+        # 受信・送信のスレッドは作らず、このクラスから直接処理を呼ぶ
+        replay_id = next(self.replay_ids)
+        channels = [f'emogo-replay-{replay_id}-{bus}' for bus in range(log.buses)]
+        addressing = Addressing(log.board_size_n, log.board_size_m, log.buses, log.scheme)
+        self.emogo = Emogo(log.board_size_n, log.board_size_m, use_asyncio=True, ko_rule=log.ko_rule,
+                           channel=channels, bustype='virtual', use_keyboard=False, clock=self.clock,
+                           addressing=addressing, debounce=log.debounce, bulk_resync=log.bulk_resync)
+        self.replayed = []  # 再生中に送信されたフレーム
+
+    def compared(self, data):
+        return self.compare_animations or not data or data[0] not in self.ANIMATION_COMMANDS
+
+    # 期限が来た演出を実行し、送信キューを空にするメソッド
+    # 実際のタイマーのスレッドと同じく、期限が来たものはその時刻に順に実行する
+    def drain(self, now):
+        animations = self.emogo.animations
+        with animations.condition:
+            while animations.timers and animations.timers[0][0] < now:
+                self.clock.now = animations.timers[0][0]
+                animations.run_due()
+            self.clock.now = now
+            animations.run_due()
+        can_interface = self.emogo.can_interface
+        for bus in range(len(can_interface.buses)):
+            while True:
+                frame = can_interface.pop_message(block=False, bus=bus)
+                if frame is None:
+                    break
+                self.replayed.append((bus, *frame))
+
+    # 記録を再生し、結果を辞書で返すメソッド（realtime が偽なら待たずに再生する）
+    def run(self, realtime=False):
+        start = time.perf_counter()
+        expected = []
+        received = 0
+        first_timestamp = None
+        for timestamp, direction, bus, can_id, data in self.log:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            now = timestamp - first_timestamp
+            if realtime:
+                delay = now - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            if direction == 'TX':
+                expected.append((bus, can_id, data))
+                continue
+            self.drain(now)
+            self.emogo.can_interface.process_message(can_id, data, bus)
+            received += 1
+            self.drain(now)
+        # 残っている演出を最後まで実行する
+        while self.emogo.animations.timers:
+            self.drain(self.emogo.animations.timers[0][0])
+        elapsed = time.perf_counter() - start
+
+        # sort は安定なので、同じバスの中の順番は変わらない
+        expected = sorted((frame for frame in expected if self.compared(frame[2])), key=lambda frame: frame[0])
+        replayed = sorted(((bus, can_id, bytes(data)) for bus, can_id, data in self.replayed if self.compared(data)),
+                          key=lambda frame: frame[0])
+        result = {
+            'frames_received': received,
+            'frames_expected': len(expected),
+            'frames_replayed': len(replayed),
+            'elapsed_s': elapsed,
+            'match': expected == replayed
+        }
+        for index, (want, got) in enumerate(itertools.zip_longest(expected, replayed)):
+            if want != got:
+                result['first_mismatch'] = {
+                    'index': index,
+                    'expected': None if want is None else f"{want[0]}:{want[1]:03X}#{want[2].hex().upper()}",
+                    'replayed': None if got is None else f"{got[0]}:{got[1]:03X}#{got[2].hex().upper()}"
+                }
+                break
+        return result
+
+    def shutdown(self):
+        self.emogo.can_interface.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay an Emogo CAN frame log")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dump_parser = subparsers.add_parser('dump', help="print the recorded frames")
+    dump_parser.add_argument('log')
+    replay_parser = subparsers.add_parser('replay', help="feed the received frames back into the rules")
+    replay_parser.add_argument('log', nargs='+')
+    replay_parser.add_argument('--realtime', action='store_true', help="keep the recorded timing")
+    replay_parser.add_argument('--compare-animations', action='store_true',
+                               help="also compare highlight and blink frames")
+    args = parser.parse_args()
+
+    if args.command == 'dump':
+        log = FrameLog(args.log)
+        print(f"# board {log.board_size_n}x{log.board_size_m}, ko rule {log.ko_rule}, "
+              f"{log.buses} bus(es) with '{log.scheme}' addressing, debounce {log.debounce * 1000:.0f} ms, "
+              f"{'bulk' if log.bulk_resync else 'per-stone'} resync, "
+              f"{len(log)} frames")
+        for timestamp, direction, bus, can_id, data in log:
+            print(f"{timestamp:.6f} {direction} {bus} {can_id:03X}#{data.hex(' ').upper()}")
+        return
+
+    failed = False
+    for path in args.log:
+        log = FrameLog(path)
+        replayer = Replayer(log, compare_animations=args.compare_animations)
+        try:
+            result = replayer.run(realtime=args.realtime)
+        finally:
+            replayer.shutdown()
+            log.close()
+        result['log'] = path
+        failed = failed or not result['match']
+        json.dump(result, sys.stdout)
+        print()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,669 @@
+# 囲碁のルール（石、連、盤面）だけのモジュール
+# 標準ライブラリ以外は読み込まないので、CAN の環境がなくても解析やテストで使え、すぐに読み込める
+
+class Stone:
+    # 定数の定義
+    COLOR_VALUES = {
+        'black': 0x01,
+        'white': 0x02
+    }
+
+    DIRECTION_VALUES = {
+        'north': 90,
+        'east': 180,
+        'south': 270,
+        'west': 0
+    }
+
+    EMOTION_VALUES = {
+        'dead': 0,
+        'defensive': 1,
+        'normal': 2,
+        'offensive': 3
+    }
+
+    def __init__(self):
+        self.color = None
+        self.direction = self.DIRECTION_VALUES['north']
+        self.emotion = self.EMOTION_VALUES['normal']
+
+    # 色を値に変換するメソッド
+    @classmethod
+    def color_value(cls, color):
+        if color in cls.COLOR_VALUES:
+            return cls.COLOR_VALUES[color]
+        elif color in cls.COLOR_VALUES.values():
+            return color
+        else:
+            raise ValueError("Invalid color")
+
+    # 向きを値に変換するメソッド
+    @classmethod
+    def direction_value(cls, direction):
+        if direction in cls.DIRECTION_VALUES:
+            return cls.DIRECTION_VALUES[direction]
+        elif direction in cls.DIRECTION_VALUES.values():
+            return direction
+        else:
+            raise ValueError("Invalid direction")
+
+    # 感情を値に変換するメソッド
+    @classmethod
+    def emotion_value(cls, emotion):
+        if emotion in cls.EMOTION_VALUES:
+            return cls.EMOTION_VALUES[emotion]
+        elif emotion in cls.EMOTION_VALUES.values():
+            return emotion
+        else:
+            raise ValueError("Invalid emotion")
+
+    # 色を設定するメソッド
+    def set_color(self, color):
+        self.color = self.color_value(color)
+
+    # 色を取得するメソッド
+    def get_color(self):
+        return self.color or 0x00  # 0x00 は石がないことを示す
+
+    # 向きを設定するメソッド
+    def set_direction(self, direction):
+        self.direction = self.direction_value(direction)
+
+    # 向きを取得するメソッド
+    def get_direction(self):
+        return self.direction or 0
+
+    # 感情を設定するメソッド
+    def set_emotion(self, emotion):
+        self.emotion = self.emotion_value(emotion)
+
+    # 感情を取得するメソッド
+    def get_emotion(self):
+        return self.emotion or self.EMOTION_VALUES['dead']
+
+class StoneView(Stone):
+    # 盤面の配列に置かれた石を Stone と同じメソッドで扱うための軽量なビュー
+    def __init__(self, board, point):
+        self.board = board
+        self.point = point
+
+    # 色は置いた後に変更できない
+    def set_color(self, color):
+        raise RuntimeError("Cannot change the color of a placed stone")
+
+    def get_color(self):
+        return self.board.points[self.point] & Board.COLOR_MASK
+
+    def set_direction(self, direction):
+        x, y = self.board.to_position(self.point)
+        self.board.set_stone_state(x, y, direction=direction)
+
+    def get_direction(self):
+        return ((self.board.points[self.point] & Board.DIRECTION_MASK) >> Board.DIRECTION_SHIFT) * 90
+
+    def set_emotion(self, emotion):
+        x, y = self.board.to_position(self.point)
+        self.board.set_stone_state(x, y, emotion=emotion)
+
+    def get_emotion(self):
+        return (self.board.points[self.point] & Board.EMOTION_MASK) >> Board.EMOTION_SHIFT
+
+class Chain:
+    # 連（同じ色で繋がった石の集まり）と、その呼吸点を保持するクラス
+    def __init__(self, color):
+        self.color = color
+        self.stones = set()     # 連に含まれる石の交点
+        self.liberties = set()  # 呼吸点（空点、または相手の死に石）の交点
+
+class BoardChange:
+    # 盤面の1回の変更（取り消し・やり直し用）
+    def __init__(self, deltas, hash_before, hash_after):
+        self.deltas = deltas  # [(交点, 変更前の値, 変更後の値), ...]
+        self.hash_before = hash_before
+        self.hash_after = hash_after
+
+class Board:
+    # 交点は周囲に1マスの枠を付けた1次元の配列で表す（交点 = x * width + y）
+    # 各交点は1バイトで、下位2ビットが色、次の2ビットが感情、その次の2ビットが向き（90度単位）
+    COLOR_MASK = 0x03
+    EMOTION_MASK = 0x0C
+    EMOTION_SHIFT = 2
+    DIRECTION_MASK = 0x30
+    DIRECTION_SHIFT = 4
+    BORDER = 0x03  # 盤外を表す色
+    ZOBRIST_SEED = 0x454D4F474F  # 局面のハッシュ値がプロセスをまたいで同じになるように固定する
+
+    tables = {}  # (n, m) -> (空の盤面, Zobrist の乱数表)（同じ大きさの盤で共有する）
+
+    def __init__(self, n, m):
+        self.n = n  # 行数
+        self.m = m  # 列数
+        self.width = m + 2  # 枠を含めた1行の長さ
+        tables = self.tables.get((n, m))
+        if tables is None:
+            tables = self.tables[(n, m)] = self.build_tables(n, m)
+        self.points = bytearray(tables[0])
+        self.offsets = (-self.width, self.width, -1, 1)  # 上下左右の隣接点
+        self.chains = [None] * len(self.points)  # 各交点が属する連
+        self.stale_chains = set()  # 感情の再計算が必要な連
+        self.dirty_stones = set()  # 前回の送信以降に状態が変わった可能性のある石
+        self.flushed_states = {}  # 最後に送信した石の状態（交点の値）
+        # Zobrist ハッシュ: 生きている石（死に石以外）の (交点, 色) ごとの乱数の XOR
+        self.zobrist = tables[1]
+        self.position_hash = 0
+        self.journal = None  # 記録中の変更（交点 -> 変更前の値）
+        self.journal_hash = 0
+
+    # 盤の大きさごとの表（枠だけの空の盤面と Zobrist の乱数表）を作るメソッド（大きさごとに1度だけ呼ばれる）
+    @classmethod
+    def build_tables(cls, n, m):
+        width = m + 2
+        points = bytearray((n + 2) * width)
+        for p in range(len(points)):
+            x, y = divmod(p, width)
+            if not (1 <= x <= n and 1 <= y <= m):
+                points[p] = cls.BORDER
+        import random  # 盤の大きさごとに1度だけ使うので、ここで読み込む
+        rnd = random.Random(cls.ZOBRIST_SEED)
+        zobrist = [(0, rnd.getrandbits(64), rnd.getrandbits(64)) for _ in points]
+        return bytes(points), zobrist
+
+    # 座標を配列のインデックスに変換するメソッド
+    def to_point(self, x, y):
+        if 1 <= x <= self.n and 1 <= y <= self.m:
+            return x * self.width + y
+        else:
+            raise IndexError(f"Position ({x}, {y}) is out of bounds")
+
+    # 配列のインデックスを座標に変換するメソッド
+    def to_position(self, p):
+        return divmod(p, self.width)
+
+    # 全ての連のリスト（[(行インデックス, 列インデックス), ...] のリスト）
+    @property
+    def connect(self):
+        chains = []
+        for chain in self.chains:
+            if chain is not None and chain not in chains:
+                chains.append(chain)
+        return [sorted((x - 1, y - 1) for x, y in map(self.to_position, chain.stones)) for chain in chains]
+
+    # 石を置くメソッド
+    def place_stone(self, x, y, color):
+        p = self.to_point(x, y)
+        if self.points[p] & self.COLOR_MASK:
+            raise RuntimeError(f"Position ({x}, {y}) already has a stone")
+        self.record_point(p)
+        self.points[p] = (Stone.color_value(color)
+                          | Stone.EMOTION_VALUES['normal'] << self.EMOTION_SHIFT
+                          | Stone.DIRECTION_VALUES['north'] // 90 << self.DIRECTION_SHIFT)
+        self.dirty_stones.add(p)
+        self.toggle_hash(p)
+        # ここで死に石判定を行う
+        self.check_dead_stones_after_placement(x, y, color)
+
+    # 石を取り除くメソッド
+    def remove_stone(self, x, y):
+        p = self.to_point(x, y)
+        if not self.points[p] & self.COLOR_MASK:
+            raise RuntimeError(f"No stone at position ({x}, {y}) to remove")
+        if self.points[p] & self.EMOTION_MASK:  # 生きている石
+            self.toggle_hash(p)
+        self.record_point(p)
+        self.points[p] = 0
+        self.dirty_stones.discard(p)
+        self.flushed_states.pop(p, None)
+        # 連を分割する（感情の再計算は次に石が置かれたときに行う）
+        self.remove_from_chains(p)
+
+    # 石を取得するメソッド
+    def get_stone(self, x, y):
+        p = self.to_point(x, y)
+        if self.points[p] & self.COLOR_MASK:
+            return StoneView(self, p)
+        return None
+
+    # 盤面の変更の記録を開始するメソッド
+    def begin_change(self):
+        self.journal = {}
+        self.journal_hash = self.position_hash
+
+    # 盤面の変更の記録を終了し、変更内容 (BoardChange) を返すメソッド
+    def end_change(self):
+        journal = self.journal
+        self.journal = None
+        deltas = [(p, old, self.points[p]) for p, old in journal.items() if old != self.points[p]]
+        return BoardChange(deltas, self.journal_hash, self.position_hash)
+
+    # 交点の変更前の値を記録するメソッド（記録中のみ）
+    def record_point(self, p):
+        if self.journal is not None and p not in self.journal:
+            self.journal[p] = self.points[p]
+
+    # 変更を取り消すメソッド（変更した交点の数に比例する時間で戻す）
+    def revert(self, change):
+        self.apply_change([(p, old) for p, old, _ in change.deltas], change.hash_before)
+
+    # 取り消した変更をやり直すメソッド
+    def reapply(self, change):
+        self.apply_change([(p, new) for p, _, new in change.deltas], change.hash_after)
+
+    # 交点の値を書き換え、変更した交点の周りの連を作り直すメソッド
+    def apply_change(self, values, position_hash):
+        points = self.points
+        chains = self.chains
+        affected = set()
+        for p, value in values:
+            self.record_point(p)
+            points[p] = value
+            if value & self.COLOR_MASK:
+                self.dirty_stones.add(p)
+            else:
+                self.dirty_stones.discard(p)
+                self.flushed_states.pop(p, None)
+            affected.add(p)
+            affected.update(p + offset for offset in self.offsets)
+        self.position_hash = position_hash
+        # 変更した交点とその隣接点を含む連を捨てて作り直す（呼吸点もここで計算し直される）
+        old_chains = {chains[q] for q in affected if chains[q] is not None}
+        seeds = set(p for p, _ in values)
+        for chain in old_chains:
+            seeds |= chain.stones
+            for q in chain.stones:
+                chains[q] = None
+        self.stale_chains -= old_chains
+        for p, _ in values:
+            chains[p] = None
+        for q in seeds:
+            if points[q] & self.COLOR_MASK and chains[q] is None:
+                self.build_chain(q)
+
+    # 盤面を複製するメソッド（解析で局面を分岐させる用、連は複製し乱数表は共有する）
+    def copy(self):
+        board = Board.__new__(Board)
+        board.__dict__.update(self.__dict__)
+        board.points = bytearray(self.points)
+        board.chains = [None] * len(self.chains)
+        copies = {}
+        for p, chain in enumerate(self.chains):
+            if chain is not None:
+                copied = copies.get(chain)
+                if copied is None:
+                    copied = copies[chain] = Chain(chain.color)
+                    copied.stones = set(chain.stones)
+                    copied.liberties = set(chain.liberties)
+                board.chains[p] = copied
+        board.stale_chains = {copies[chain] for chain in self.stale_chains}
+        board.dirty_stones = set(self.dirty_stones)
+        board.flushed_states = dict(self.flushed_states)
+        board.journal = None
+        return board
+
+    # 交点の石を局面のハッシュ値に加える（取り除く）メソッド
+    def toggle_hash(self, p):
+        self.position_hash ^= self.zobrist[p][self.points[p] & self.COLOR_MASK]
+
+    # 連の石のハッシュ値（XOR）を求めるメソッド
+    def chain_hash(self, chain):
+        value = 0
+        for q in chain.stones:
+            value ^= self.zobrist[q][chain.color]
+        return value
+
+    # 石を置いた後の局面のハッシュ値を、盤面を変更せずに求めるメソッド
+    # 取られる石と自殺手だけを考慮する（置いた石に隣接する連だけを調べる）
+    def hash_after_move(self, x, y, color):
+        p = self.to_point(x, y)
+        if self.points[p] & self.COLOR_MASK:
+            raise RuntimeError(f"Position ({x}, {y}) already has a stone")
+        color = Stone.color_value(color)
+        new_hash = self.position_hash ^ self.zobrist[p][color]
+        has_liberty = False
+        own_chains = []
+        captured = []
+        for offset in self.offsets:
+            q = p + offset
+            value = self.points[q]
+            neighbor_color = value & self.COLOR_MASK
+            if neighbor_color == 0:
+                has_liberty = True
+            elif neighbor_color == self.BORDER:
+                continue
+            elif neighbor_color == color:
+                if self.chains[q] not in own_chains:
+                    own_chains.append(self.chains[q])
+            elif not value & self.EMOTION_MASK:  # 相手の死に石は呼吸点になる
+                has_liberty = True
+            elif self.chains[q].liberties == {p} and self.chains[q] not in captured:
+                captured.append(self.chains[q])
+        for chain in captured:
+            new_hash ^= self.chain_hash(chain)
+        if captured or has_liberty or any(chain.liberties - {p} for chain in own_chains):
+            return new_hash
+        # 自殺手: 置いた石と繋がった連が死に石になる
+        new_hash ^= self.zobrist[p][color]
+        for chain in own_chains:
+            if self.points[next(iter(chain.stones))] & self.EMOTION_MASK:
+                new_hash ^= self.chain_hash(chain)
+        return new_hash
+
+    # 死に石判定を行うメソッド
+    # 置かれた石と隣接する連だけを更新するので、盤面全体の探索は行わない
+    def check_dead_stones_after_placement(self, x, y, color):
+        p = self.to_point(x, y)
+        chain = self.add_to_chains(p)
+
+        # 1. 隣接する相手の連を先に判定する（取った石の分だけ自分の呼吸点が増えるため）
+        opponent_chains = []
+        for offset in self.offsets:
+            neighbor_chain = self.chains[p + offset]
+            if neighbor_chain is not None and neighbor_chain is not chain and neighbor_chain not in opponent_chains:
+                opponent_chains.append(neighbor_chain)
+
+        # 2. 自分の連、3. 呼吸点が変化したその他の連の順に感情を更新する
+        self.update_emotions(opponent_chains + [chain])
+
+    # 置かれた石を連に加え、隣接する同色の連と結合するメソッド
+    def add_to_chains(self, p):
+        points = self.points
+        color = points[p] & self.COLOR_MASK
+        chain = Chain(color)
+        chain.stones.add(p)
+        self.chains[p] = chain
+
+        for offset in self.offsets:
+            q = p + offset
+            value = points[q]
+            neighbor_color = value & self.COLOR_MASK
+            if neighbor_color == 0:
+                chain.liberties.add(q)
+            elif neighbor_color != self.BORDER:
+                neighbor_chain = self.chains[q]
+                neighbor_chain.liberties.discard(p)
+                if neighbor_color == color:
+                    if neighbor_chain is not chain:
+                        chain = self.merge_chains(chain, neighbor_chain)
+                else:
+                    if not value & self.EMOTION_MASK:  # 死に石
+                        chain.liberties.add(q)
+                    self.stale_chains.add(neighbor_chain)
+        self.stale_chains.add(chain)
+        return chain
+
+    # 2つの連を結合するメソッド（小さい方を大きい方に付け替える）
+    def merge_chains(self, chain_a, chain_b):
+        if len(chain_a.stones) < len(chain_b.stones):
+            chain_a, chain_b = chain_b, chain_a
+        for q in chain_b.stones:
+            self.chains[q] = chain_a
+        chain_a.stones |= chain_b.stones
+        chain_a.liberties |= chain_b.liberties
+        self.stale_chains.discard(chain_b)
+        return chain_a
+
+    # 取り除かれた石を連から外し、必要なら連を分割するメソッド
+    def remove_from_chains(self, p):
+        chain = self.chains[p]
+        self.chains[p] = None
+        self.stale_chains.discard(chain)
+
+        # 取り除かれた点は隣接する連の呼吸点になる
+        for offset in self.offsets:
+            neighbor_chain = self.chains[p + offset]
+            if neighbor_chain is not None and neighbor_chain is not chain:
+                neighbor_chain.liberties.add(p)
+                self.stale_chains.add(neighbor_chain)
+
+        # 残った石から連を作り直す（影響を受けるのは元の連の石だけ）
+        for offset in self.offsets:
+            if self.chains[p + offset] is chain:
+                self.build_chain(p + offset)
+
+    # 指定した石から連を探索して作り直すメソッド
+    def build_chain(self, p):
+        points = self.points
+        chains = self.chains
+        color = points[p] & self.COLOR_MASK
+        chain = Chain(color)
+        chains[p] = chain
+        stack = [p]
+
+        while stack:
+            q = stack.pop()
+            chain.stones.add(q)
+            for offset in self.offsets:
+                r = q + offset
+                value = points[r]
+                neighbor_color = value & self.COLOR_MASK
+                if neighbor_color == 0:
+                    chain.liberties.add(r)
+                elif neighbor_color == color:
+                    if chains[r] is not chain:
+                        chains[r] = chain
+                        stack.append(r)
+                elif neighbor_color != self.BORDER and not value & self.EMOTION_MASK:  # 相手の死に石
+                    chain.liberties.add(r)
+        self.stale_chains.add(chain)
+        return chain
+
+    # 石の死活が変わったとき、隣接する相手の連の呼吸点を更新するメソッド
+    # 呼吸点が変化した連（アタリになった、またはアタリでなくなった連はその相手の連も）のリストを返す
+    def update_dead_liberty(self, p, dead):
+        color = self.points[p] & self.COLOR_MASK
+        changed = []
+        for offset in self.offsets:
+            neighbor_chain = self.chains[p + offset]
+            if neighbor_chain is not None and neighbor_chain.color != color:
+                was_atari = len(neighbor_chain.liberties) == 1
+                if dead:
+                    neighbor_chain.liberties.add(p)
+                else:
+                    neighbor_chain.liberties.discard(p)
+                changed.append(neighbor_chain)
+                if was_atari != (len(neighbor_chain.liberties) == 1):
+                    changed.extend(self.opponent_chains(neighbor_chain))
+        return changed
+
+    # 連の感情を設定するメソッド（感情を再計算する必要がある相手の連のリストを返す）
+    # 死活が変わると相手の連の呼吸点が、アタリの状態が変わると相手の連の 'offensive' が変わる
+    def set_chain_emotion(self, chain, emotion):
+        points = self.points
+        bits = Stone.EMOTION_VALUES[emotion] << self.EMOTION_SHIFT
+        defensive = Stone.EMOTION_VALUES['defensive'] << self.EMOTION_SHIFT
+        changed = []
+        atari_changed = False
+        for q in chain.stones:
+            value = points[q]
+            old_bits = value & self.EMOTION_MASK
+            if old_bits == bits:
+                continue
+            self.record_point(q)
+            points[q] = value & ~self.EMOTION_MASK | bits
+            self.dirty_stones.add(q)
+            if not old_bits or not bits:  # 死活が変わった
+                self.toggle_hash(q)
+                changed.extend(self.update_dead_liberty(q, not bits))
+            if old_bits == defensive or bits == defensive:
+                atari_changed = True
+        if atari_changed:
+            changed.extend(self.opponent_chains(chain))
+        return changed
+
+    # 連に隣接する相手の連のリストを取得するメソッド
+    def opponent_chains(self, chain):
+        chains = self.chains
+        neighbors = []
+        for q in chain.stones:
+            for offset in self.offsets:
+                neighbor_chain = chains[q + offset]
+                if neighbor_chain is not None and neighbor_chain.color != chain.color and neighbor_chain not in neighbors:
+                    neighbors.append(neighbor_chain)
+        return neighbors
+
+    # 連が相手の連をアタリにしているか（次の手で取れるか）判定するメソッド
+    def threatens(self, chain):
+        chains = self.chains
+        for q in chain.stones:
+            for offset in self.offsets:
+                neighbor_chain = chains[q + offset]
+                if (neighbor_chain is not None and neighbor_chain.color != chain.color
+                        and len(neighbor_chain.liberties) == 1):
+                    return True
+        return False
+
+    # 呼吸点の数から連の感情を決めるメソッド
+    @staticmethod
+    def emotion_for_liberties(liberties_count):
+        if liberties_count == 0:
+            return 'dead'
+        elif liberties_count == 1:
+            return 'defensive'
+        return 'normal'
+
+    # 連の感情を決めるメソッド
+    # 呼吸点が2つ以上あり、相手の連をアタリにしている連は 'offensive' になる（自分のアタリを優先する）
+    def chain_emotion(self, chain):
+        emotion = self.emotion_for_liberties(len(chain.liberties))
+        if emotion == 'normal' and self.threatens(chain):
+            return 'offensive'
+        return emotion
+
+    # 呼吸点が変化した連の感情を更新するメソッド
+    # 連が死んだ（生き返った）場合は隣接する相手の連も続けて更新する
+    def update_emotions(self, first_chains=()):
+        pending = list(first_chains)
+        pending.extend(chain for chain in self.stale_chains if chain not in first_chains)
+        self.stale_chains = set()
+        queued = set(pending)
+
+        i = 0
+        while i < len(pending):
+            chain = pending[i]
+            i += 1
+            queued.discard(chain)
+            emotion = self.chain_emotion(chain)
+            for changed_chain in self.set_chain_emotion(chain, emotion):
+                if changed_chain not in queued:
+                    queued.add(changed_chain)
+                    pending.append(changed_chain)
+
+    # 連と感情を盤面全体から再計算するメソッド
+    def check_connect(self):
+        self.chains = [None] * len(self.points)
+        self.stale_chains = set()
+        for p, value in enumerate(self.points):
+            color = value & self.COLOR_MASK
+            if color and color != self.BORDER and self.chains[p] is None:
+                self.build_chain(p)
+        self.update_emotions()
+
+    # 指定された位置の石が属する連を取得するメソッド
+    def get_chain(self, x, y):
+        chain = self.chains[self.to_point(x, y)]
+        if chain is None:
+            raise RuntimeError(f"No stone at position ({x}, {y})")
+        return chain
+
+    # 指定された位置の石と連絡している石を取得するメソッド（死に石も含む）
+    def get_connect(self, x, y):
+        return [self.to_position(p) for p in sorted(self.get_chain(x, y).stones)]
+
+    # 指定された位置の石が属する連の呼吸点を取得するメソッド
+    def get_liberties(self, x, y):
+        return [self.to_position(p) for p in sorted(self.get_chain(x, y).liberties)]
+
+    # 指定された位置の石が属する連の、呼吸点の数と相手の連のアタリから決まる感情を取得するメソッド
+    def get_group_emotion(self, x, y):
+        return Stone.EMOTION_VALUES[self.chain_emotion(self.get_chain(x, y))]
+
+    # 石の数を数えるメソッド
+    def stone_counts(self):
+        counts = [0] * 256
+        for value in self.points:
+            counts[value & (self.COLOR_MASK | self.EMOTION_MASK)] += 1
+        black = Stone.COLOR_VALUES['black']
+        white = Stone.COLOR_VALUES['white']
+        live = [emotion << self.EMOTION_SHIFT for emotion in Stone.EMOTION_VALUES.values() if emotion]
+        return {'black': sum(counts[black | bits] for bits in live),
+                'white': sum(counts[white | bits] for bits in live)}
+
+    # 交点の値から石の状態を取り出すメソッド
+    def unpack_state(self, p):
+        value = self.points[p]
+        x, y = divmod(p, self.width)
+        return {
+            'x': x,
+            'y': y,
+            'color': value & self.COLOR_MASK,
+            'emotion': (value & self.EMOTION_MASK) >> self.EMOTION_SHIFT,
+            'direction': ((value & self.DIRECTION_MASK) >> self.DIRECTION_SHIFT) * 90
+        }
+
+    # 石が置かれている交点を順に返すメソッド
+    def stone_points(self):
+        points = self.points
+        for x in range(1, self.n + 1):
+            start = x * self.width + 1
+            for p in range(start, start + self.m):
+                if points[p] & self.COLOR_MASK:
+                    yield p
+
+    # ボードの状態を取得するメソッド
+    def get_board_state(self):
+        return [self.unpack_state(p) for p in self.stone_points()]
+
+    # 指定した行の各交点の (色, 感情) を取得するメソッド（石がない交点の色は 0）
+    # points を渡すと、現在の盤面の代わりにそのコピーから取得する
+    def get_row(self, x, points=None):
+        if points is None:
+            points = self.points
+        start = self.to_point(x, 1)
+        return [(value & self.COLOR_MASK, (value & self.EMOTION_MASK) >> self.EMOTION_SHIFT)
+                for value in points[start:start + self.m]]
+
+    # 前回の送信以降に状態（色、感情、向き）が変わった石の状態を取得するメソッド
+    # 取得した状態は送信済みとして記録される
+    def pop_changed_states(self):
+        points = self.points
+        state = []
+        for p in sorted(self.dirty_stones):
+            value = points[p]
+            if value & self.COLOR_MASK and self.flushed_states.get(p) != value:
+                self.flushed_states[p] = value
+                state.append(self.unpack_state(p))
+        self.dirty_stones = set()
+        return state
+
+    # 指定した石を未送信に戻すメソッド（次の送信で状態を送り直す）
+    def mark_unflushed(self, x, y):
+        p = self.to_point(x, y)
+        self.flushed_states.pop(p, None)
+        self.dirty_stones.add(p)
+
+    # 全ての石を送信済みとして記録するメソッド（全体の再送信用）
+    def mark_all_flushed(self):
+        self.dirty_stones = set()
+        self.flushed_states = {p: self.points[p] for p in self.stone_points()}
+
+    # 指定した碁石の状態（感情、向き）を直接変更するメソッド
+    def set_stone_state(self, x, y, emotion=None, direction=None):
+        p = self.to_point(x, y)
+        value = self.points[p]
+        if not value & self.COLOR_MASK:
+            raise RuntimeError(f"No stone at position ({x}, {y}) to set state")
+        if emotion is not None:
+            bits = Stone.emotion_value(emotion) << self.EMOTION_SHIFT
+            value = value & ~self.EMOTION_MASK | bits
+        if direction is not None:
+            bits = Stone.direction_value(direction) // 90 << self.DIRECTION_SHIFT
+            value = value & ~self.DIRECTION_MASK | bits
+        was_dead = not self.points[p] & self.EMOTION_MASK
+        self.record_point(p)
+        self.points[p] = value
+        self.dirty_stones.add(p)
+        if emotion is not None:
+            if was_dead != (not value & self.EMOTION_MASK):
+                self.toggle_hash(p)
+                self.stale_chains.update(self.update_dead_liberty(p, not was_dead))
+            # 次に石が置かれたときに連の感情を再計算する
+            self.stale_chains.add(self.chains[p])
@@ -0,0 +1,84 @@
+# 地を数えて勝敗を判定するモジュール
+# 空点の領域を1度ずつ塗りつぶし、接している石が1色だけの領域をその色の地とする
+# 盤面を1回たどるだけなので、着手ごとの形勢の表示にも使える
+
+BLACK = 0x01  # Stone.COLOR_VALUES と同じ値
+WHITE = 0x02
+
+class Scorer:
+    # 'area' は石と地の合計（中国ルール）、'territory' は地とアゲハマの合計（日本ルール）で数える
+    # 盤上の石は全て生きているものとして数える（死に石は取り除かれてから数える）
+    RULES = ('area', 'territory')
+
+    def __init__(self, board, rule='area', komi=6.5):
+        if rule not in self.RULES:
+            raise ValueError("Invalid scoring rule")
+        self.board = board
+        self.rule = rule
+        self.komi = komi
+        points = board.points
+        # 盤上の交点と、その盤上の隣接点の表（最初に1度だけ作る）
+        self.playable = [p for p in range(len(points)) if points[p] != board.BORDER]
+        self.neighbors = [()] * len(points)
+        for p in self.playable:
+            self.neighbors[p] = tuple(p + offset for offset in board.offsets if points[p + offset] != board.BORDER)
+        # 交点の値 -> 生きている石の色（空点、死に石、盤外は 0）
+        self.owners = bytes(
+            value & board.COLOR_MASK if value & board.COLOR_MASK in (BLACK, WHITE) and value & board.EMOTION_MASK else 0
+            for value in range(256)
+        )
+
+    # 各色の石と地の数を数えるメソッド（死に石の交点は空点とみなす）
+    def count(self):
+        points = self.board.points
+        owners = self.owners
+        neighbors = self.neighbors
+        stones = [0, 0, 0]
+        territory = [0, 0, 0]
+        seen = bytearray(len(points))
+        for p in self.playable:
+            color = owners[points[p]]
+            if color:
+                stones[color] += 1
+                continue
+            if seen[p]:
+                continue
+            # 空点の領域を塗りつぶし、接している石の色を集める
+            seen[p] = 1
+            stack = [p]
+            size = 0
+            border = 0
+            while stack:
+                q = stack.pop()
+                size += 1
+                for r in neighbors[q]:
+                    color = owners[points[r]]
+                    if color:
+                        border |= color
+                    elif not seen[r]:
+                        seen[r] = 1
+                        stack.append(r)
+            if border == BLACK or border == WHITE:
+                territory[border] += size
+        return stones, territory
+
+    # 得点を計算するメソッド（captures は色ごとに取った石の数）
+    def score(self, captures=None):
+        if captures is None:
+            captures = {'black': 0, 'white': 0}
+        stones, territory = self.count()
+        result = {'rule': self.rule, 'komi': self.komi}
+        for name, color in (('black', BLACK), ('white', WHITE)):
+            total = stones[color] + territory[color] if self.rule == 'area' else territory[color] + captures[name]
+            if color == WHITE:
+                total += self.komi
+            result[name] = {
+                'stones': stones[color],
+                'territory': territory[color],
+                'captures': captures[name],
+                'total': total
+            }
+        margin = result['black']['total'] - result['white']['total']
+        result['winner'] = 'black' if margin > 0 else 'white' if margin < 0 else None
+        result['margin'] = abs(margin)
+        return result
@@ -0,0 +1,472 @@
+import argparse
+import array
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+
+from emogo_rules import Board, Stone
+from emogo_score import Scorer
+
+# 棋譜（SGF）の書き出しと、SGF の棋譜集をまとめて解析するモジュール
+# 書き出し: python3 emogo.py --sgf game.sgf（対局しながら1手ごとに書き足し、ファイルは常に SGF として読める）
+# 解析: python3 emogo_sgf.py analyze games/*.sgf -o timelines.emtl
+#   棋譜集を1局ずつ読み出し（ファイル全体は読み込まない）、プロセスのプールで Board のルールに通して
+#   1手ごとの感情の推移を列ごとのファイルに書く（メモリの使用量は棋譜集の大きさによらない）
+# 集計: python3 emogo_sgf.py summary timelines.emtl
+#
+# SGF の座標は (列, 行) の順で、Emogo の (x, y) は (行, 列) なので入れ替える（'cd' は x = 4, y = 3）
+#
+# 解析結果のファイル形式（リトルエンディアン）
+#   ヘッダ: 'EMTL', バージョン (u16), 予約 (10バイト)
+#   チャンク: 種類 (1バイト, 'G': 対局, 'M': 着手), 行数 (u32), 列の数 (u8), 列 × 列の数
+#   列: 名前の長さ (u8), 名前 (ASCII), 型 (1バイト, array の型コード、'b' は可変長のバイト列), 圧縮後の長さ (u32),
+#       zlib で圧縮したデータ（'b' の列は各行の長さ (u16) の並びの後に内容を続けたもの）
+#   着手の列: game, move, color (1: 黒, 2: 白), x, y (パスは 0), <色>.<感情> の石の数,
+#             captures.black, captures.white, margin（黒から見た差、コミ込み）,
+#             board（着手の直後の各交点の 色 | 感情 << 2 を行ごとに 4 ビットずつ下位から詰めたもの）
+#   対局の列: game, source, index, size_n, size_m, komi, moves, result, black, white, margin, error
+
+MAGIC = b'EMTL'
+VERSION = 1
+HEADER = struct.Struct('<4sH10x')
+CHUNK = struct.Struct('<cIB')
+COLUMN = struct.Struct('<cI')  # 型, 圧縮後の長さ（名前の後に置く）
+BLOB = 'b'  # 可変長のバイト列の型
+GAME_COLUMNS = (('game', 'I'), ('source', BLOB), ('index', 'I'), ('size_n', 'B'), ('size_m', 'B'), ('komi', 'f'),
+                ('moves', 'H'), ('result', BLOB), ('black', BLOB), ('white', BLOB), ('margin', 'f'),
+                ('error', BLOB))
+EMOTIONS = sorted(Stone.EMOTION_VALUES, key=Stone.EMOTION_VALUES.get)
+MOVE_COLUMNS = ((('game', 'I'), ('move', 'H'), ('color', 'B'), ('x', 'B'), ('y', 'B'))
+                + tuple((f"{color}.{emotion}", 'H') for color in Stone.COLOR_VALUES for emotion in EMOTIONS)
+                + (('captures.black', 'H'), ('captures.white', 'H'), ('margin', 'f'), ('board', BLOB)))
+RULE_NAMES = {'area': 'Chinese', 'territory': 'Japanese'}
+NIBBLES = bytes(value & 0x0F for value in range(256))  # 交点の値 -> 色 | 感情 << 2
+READ_SIZE = 1 << 16
+
+# 座標を SGF の座標に変換するメソッド（None はパス）
+def to_sgf(position):
+    if position is None:
+        return ''
+    x, y = position
+    return chr(ord('a') + y - 1) + chr(ord('a') + x - 1)
+
+# SGF の座標を (x, y) に変換するメソッド（パスは None）
+def from_sgf(value, board_size_n, board_size_m):
+    if not value or (value == 'tt' and board_size_n <= 19 and board_size_m <= 19):
+        return None
+    if len(value) != 2:
+        raise ValueError(f"Invalid SGF point: {value!r}")
+    x = ord(value[1]) - ord('a') + 1
+    y = ord(value[0]) - ord('a') + 1
+    if not (1 <= x <= board_size_n and 1 <= y <= board_size_m):
+        raise IndexError(f"SGF point {value!r} is out of bounds")
+    return x, y
+
+# SGF の値の中の文字をエスケープするメソッド
+def escape(text):
+    return text.replace('\\', '\\\\').replace(']', '\\]')
+
+class SGFWriter:
+    # 対局の棋譜を1手ごとに書き足すクラス
+    # ファイルは常に ')' で終わり、着手は ')' を上書きして書き足す（取り消しは前の手の終わりまで切り詰める）
+    # setup で対局の途中の盤面（再開した対局など）を置き石として書く
+    def __init__(self, path, board_size_n, board_size_m, komi=6.5, rule='area', setup=(), player='black'):
+        self.path = path
+        self.header = (board_size_n, board_size_m, komi, rule, list(setup), player)
+        self.root = self.make_root()
+        self.file = open(path, 'w+b')
+        self.file.write(self.root + b')')
+        self.file.flush()
+        self.offsets = []  # 各着手を書き始めた位置
+        self.moves = []
+
+    # ルートのノードを作るメソッド
+    def make_root(self, result=None):
+        board_size_n, board_size_m, komi, rule, setup, player = self.header
+        size = str(board_size_n) if board_size_n == board_size_m else f"{board_size_m}:{board_size_n}"
+        root = (f"(;GM[1]FF[4]CA[UTF-8]AP[EmoGo]SZ[{size}]KM[{komi}]RU[{RULE_NAMES.get(rule, rule)}]"
+                f"DT[{time.strftime('%Y-%m-%d')}]")
+        for name, color in (('AB', Stone.COLOR_VALUES['black']), ('AW', Stone.COLOR_VALUES['white'])):
+            points = [to_sgf((x, y)) for stone_color, x, y in setup if stone_color == color]
+            if points:
+                root += name + ''.join(f"[{point}]" for point in points)
+        if setup and player == 'white':
+            root += 'PL[W]'
+        if result is not None:
+            root += f"RE[{escape(result)}]"
+        return root.encode()
+
+    # 着手（position が None ならパス）を書き足すメソッド
+    def add(self, player, position):
+        node = f";{'B' if player == 'black' else 'W'}[{to_sgf(position)}]".encode()
+        self.file.seek(-1, os.SEEK_END)
+        self.offsets.append(self.file.tell())
+        self.moves.append(node)
+        self.file.write(node + b')')
+        self.file.flush()
+
+    # 最後の着手を取り消すメソッド
+    def undo(self):
+        if not self.offsets:
+            return
+        self.file.seek(self.offsets.pop())
+        self.moves.pop()
+        self.file.truncate()
+        self.file.write(b')')
+        self.file.flush()
+
+    # 終局の結果（Emogo.calculate_final_score の戻り値）をルートに書き、ファイル全体を書き直すメソッド
+    def finish(self, result):
+        if result['winner'] is None:
+            text = '0'
+        else:
+            text = f"{'B' if result['winner'] == 'black' else 'W'}+{result['margin']:g}"
+        self.root = self.make_root(text)
+        data = self.root + b''.join(self.moves) + b')'
+        self.file.seek(0)
+        self.file.write(data)
+        self.file.truncate()
+        self.file.flush()
+        self.offsets = []  # 終局後は取り消さない
+
+    def close(self):
+        self.file.close()
+
+# 棋譜集のテキストから1局ずつ SGF のテキストを取り出すジェネレータ（stream は read(size) を持つテキストのストリーム）
+# 括弧の対応と [] の中だけを見るので速く、読み込むのは1局分と READ_SIZE だけ
+SPECIAL = re.compile(r'[()\[\]\\]')
+
+def iter_game_texts(stream):
+    depth = 0
+    in_value = False
+    skip = -1  # '\' の次の文字の位置（エスケープされているので無視する）
+    parts = []
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        start = 0 if depth else None
+        for match in SPECIAL.finditer(chunk):
+            i = match.start()
+            if i == skip:
+                continue
+            c = chunk[i]
+            if in_value:
+                if c == '\\':
+                    skip = i + 1
+                elif c == ']':
+                    in_value = False
+            elif c == '[':
+                in_value = True
+            elif c == '(':
+                if depth == 0:
+                    start = i
+                depth += 1
+            elif c == ')' and depth:
+                depth -= 1
+                if depth == 0:
+                    parts.append(chunk[start:i + 1])
+                    yield ''.join(parts)
+                    parts = []
+                    start = None
+        if depth:
+            parts.append(chunk[start:])
+        skip = 0 if skip == len(chunk) else -1
+
+TOKEN = re.compile(r'\s*(?:([();])|([A-Za-z]+)|\[((?:[^\]\\]|\\.)*)\])', re.S)
+ESCAPED = re.compile(r'\\(\r\n?|\n\r?|.)', re.S)
+
+# SGF の値のエスケープを戻すメソッド（'\' の後の改行は消し、それ以外の文字はそのまま残す）
+def unescape(value):
+    return ESCAPED.sub(lambda match: '' if match.group(1)[0] in '\r\n' else match.group(1), value)
+
+class SGFGame:
+    # 読み込んだ1局（properties はルートのプロパティ、setup は置き石、moves は [(色, (x, y) または None), ...]）
+    def __init__(self, properties, setup, moves):
+        self.properties = properties
+        self.setup = setup
+        self.moves = moves
+        size = properties.get('SZ', '19')
+        columns, _, rows = size.partition(':')
+        self.size_m = int(columns)
+        self.size_n = int(rows or columns)
+        self.komi = float(properties.get('KM') or 0)
+
+# SGF のテキストを読み、ルートのプロパティと本譜（最初の変化）の着手を返すメソッド
+def parse_game(text):
+    nodes = []
+    node = None
+    name = None
+    position = 0
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            if text[position:].strip():
+                raise ValueError(f"Invalid SGF at offset {position}")
+            break
+        position = match.end()
+        symbol, identifier, value = match.groups()
+        if symbol == ';':
+            node = []
+            nodes.append(node)
+            name = None
+        elif symbol == ')':
+            break  # 最初の変化の終わりが本譜の終わり
+        elif identifier is not None:
+            name = identifier.upper()
+        elif value is not None and node is not None and name is not None:
+            node.append((name, unescape(value) if '\\' in value else value))
+    if not nodes:
+        raise ValueError("SGF has no nodes")
+    properties = {}
+    for name, value in nodes[0]:
+        properties.setdefault(name, value)
+    game = SGFGame(properties, [], [])
+    colors = {'B': 'black', 'W': 'white', 'AB': 'black', 'AW': 'white'}
+    for index, node in enumerate(nodes):
+        for name, value in node:
+            if name in ('AB', 'AW'):
+                if index:
+                    raise ValueError("Setup stones after the first node are not supported")
+                game.setup.append((colors[name], from_sgf(value, game.size_n, game.size_m)))
+            elif name in ('B', 'W'):
+                game.moves.append((colors[name], from_sgf(value, game.size_n, game.size_m)))
+    return game
+
+# 1局を Board のルールに通し、着手ごとの列の値を返すメソッド（ワーカーのプロセスで実行する）
+# 着手の直後の感情を記録し、死に石は次の着手の前に取り除く（碁盤で対局者が取り除くのと同じ）
+def analyze_game(item):
+    number, source, index, text, rule = item
+    row = {'game': number, 'source': source, 'index': index, 'size_n': 0, 'size_m': 0, 'komi': 0.0, 'moves': 0,
+           'result': '', 'black': '', 'white': '', 'margin': 0.0, 'error': ''}
+    columns = {name: [] for name, _ in MOVE_COLUMNS}
+    try:
+        game = parse_game(text)
+        row.update(size_n=game.size_n, size_m=game.size_m, komi=game.komi, result=game.properties.get('RE', ''),
+                   black=game.properties.get('PB', ''), white=game.properties.get('PW', ''))
+        board = Board(game.size_n, game.size_m)
+        scorer = Scorer(board, rule, game.komi)
+        captures = {'black': 0, 'white': 0}
+        for color, position in game.setup:
+            if position is not None:
+                board.place_stone(*position, color)
+        counters = [(f"{color}.{emotion}", bytes([value | Stone.EMOTION_VALUES[emotion] << Board.EMOTION_SHIFT]))
+                    for color, value in Stone.COLOR_VALUES.items() for emotion in EMOTIONS]
+        rows = [slice(x * board.width + 1, x * board.width + 1 + board.m) for x in range(1, board.n + 1)]
+        margin = 0.0
+        for move, (color, position) in enumerate(game.moves, 1):
+            if position is not None:
+                board.place_stone(*position, color)
+            nibbles = board.points.translate(NIBBLES)
+            result = scorer.score(captures)
+            margin = result['black']['total'] - result['white']['total']
+            columns['game'].append(number)
+            columns['move'].append(move)
+            columns['color'].append(Stone.COLOR_VALUES[color])
+            columns['x'].append(position[0] if position else 0)
+            columns['y'].append(position[1] if position else 0)
+            for name, value in counters:
+                columns[name].append(nibbles.count(value))
+            columns['captures.black'].append(captures['black'])
+            columns['captures.white'].append(captures['white'])
+            columns['margin'].append(margin)
+            plane = b''.join(nibbles[part] for part in rows)
+            if len(plane) & 1:
+                plane += b'\x00'
+            columns['board'].append(bytes(a | b << 4 for a, b in zip(plane[0::2], plane[1::2])))
+            # 死に石を取り除き、相手のアゲハマにする（自殺手の石も相手が取ったことになる）
+            if not columns['black.dead'][-1] and not columns['white.dead'][-1]:
+                continue
+            for p in [p for p in board.stone_points() if not board.points[p] & Board.EMOTION_MASK]:
+                dead_color = board.points[p] & Board.COLOR_MASK
+                captures['white' if dead_color == Stone.COLOR_VALUES['black'] else 'black'] += 1
+                board.remove_stone(*board.to_position(p))
+        row['moves'] = len(game.moves)
+        row['margin'] = margin
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+        row['moves'] = len(columns['move'])
+    return row, columns
+
+class TimelineWriter:
+    # 解析結果を列ごとにまとめて書くクラス（rows 行ごとにチャンクを書き、それより多くはメモリに溜めない）
+    def __init__(self, path, rows=8192):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.rows = rows
+        self.games = {name: [] for name, _ in GAME_COLUMNS}
+        self.moves = {name: [] for name, _ in MOVE_COLUMNS}
+
+    # 1局分の結果（analyze_game の戻り値）を加えるメソッド
+    def add(self, row, columns):
+        for name, _ in GAME_COLUMNS:
+            self.games[name].append(row[name])
+        for name, _ in MOVE_COLUMNS:
+            self.moves[name].extend(columns[name])
+        if len(self.moves['game']) >= self.rows:
+            self.write_chunk(b'M', MOVE_COLUMNS, self.moves)
+        if len(self.games['game']) >= self.rows:
+            self.write_chunk(b'G', GAME_COLUMNS, self.games)
+
+    # 溜めた行をチャンクとして書き、空にするメソッド
+    def write_chunk(self, kind, layout, columns):
+        count = len(columns[layout[0][0]])
+        if not count:
+            return
+        parts = [CHUNK.pack(kind, count, len(layout))]
+        for name, typecode in layout:
+            values = columns[name]
+            if typecode == BLOB:
+                values = [value.encode() if isinstance(value, str) else value for value in values]
+                data = to_bytes('H', [len(value) for value in values]) + b''.join(values)
+            else:
+                data = to_bytes(typecode, values)
+            data = zlib.compress(data, 6)
+            encoded = name.encode()
+            parts.append(bytes([len(encoded)]) + encoded + COLUMN.pack(typecode.encode(), len(data)) + data)
+            columns[name].clear()
+        self.file.write(b''.join(parts))
+
+    def close(self):
+        self.write_chunk(b'M', MOVE_COLUMNS, self.moves)
+        self.write_chunk(b'G', GAME_COLUMNS, self.games)
+        self.file.close()
+
+# 値のリストをリトルエンディアンのバイト列にするメソッド
+def to_bytes(typecode, values):
+    data = array.array(typecode, values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+# バイト列を値のリストに戻すメソッド
+def from_bytes(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+# 解析結果を1チャンクずつ読むジェネレータ（(種類 'G' / 'M', {列の名前: 値のリスト}) を返す）
+# columns を指定すると、その列だけを展開する（他の列は読み飛ばす）
+def read_timelines(path, columns=None):
+    with open(path, 'rb') as f:
+        magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an EmoGo timeline file (version {VERSION})")
+        while True:
+            header = f.read(CHUNK.size)
+            if not header:
+                return
+            kind, count, column_count = CHUNK.unpack(header)
+            chunk = {}
+            for _ in range(column_count):
+                name = f.read(f.read(1)[0]).decode()
+                typecode, length = COLUMN.unpack(f.read(COLUMN.size))
+                typecode = typecode.decode()
+                if columns is not None and name not in columns:
+                    f.seek(length, os.SEEK_CUR)
+                    continue
+                data = zlib.decompress(f.read(length))
+                if typecode == BLOB:
+                    lengths = from_bytes('H', data[:count * 2])
+                    values = []
+                    offset = count * 2
+                    for size in lengths:
+                        values.append(data[offset:offset + size])
+                        offset += size
+                    chunk[name] = values
+                else:
+                    chunk[name] = from_bytes(typecode, data)
+            yield kind.decode(), chunk
+
+# 棋譜のファイル（またはディレクトリの中の .sgf）から1局ずつ (ファイル名, ファイル内の番号, テキスト) を返すジェネレータ
+def iter_games(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path)
+                           for name in names if name.lower().endswith('.sgf'))
+        else:
+            files = [path]
+        for name in files:
+            with open(name, encoding='utf-8', errors='replace') as f:
+                for index, text in enumerate(iter_game_texts(f)):
+                    yield name, index, text
+
+# 棋譜集を解析して TimelineWriter に書くメソッド（統計情報の辞書を返す）
+# プールに渡す対局は workers * window 局までにして、読み込みと結果のメモリを一定に保つ
+def analyze(paths, output, workers=None, rule='area', window=4, rows=8192):
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    workers = workers or os.cpu_count() or 1
+    writer = TimelineWriter(output, rows)
+    stats = {'games': 0, 'moves': 0, 'errors': 0}
+    start = time.monotonic()
+
+    def collect(futures):
+        for future in futures:
+            row, columns = future.result()
+            writer.add(row, columns)
+            stats['games'] += 1
+            stats['moves'] += len(columns['move'])
+            if row['error']:
+                stats['errors'] += 1
+
+    try:
+        with ProcessPoolExecutor(workers) as executor:
+            pending = set()
+            for number, (source, index, text) in enumerate(iter_games(paths)):
+                if len(pending) >= workers * window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(analyze_game, (number, source, index, text, rule)))
+            collect(wait(pending)[0])
+    finally:
+        writer.close()
+    stats['elapsed_s'] = time.monotonic() - start
+    stats['moves_per_s'] = stats['moves'] / stats['elapsed_s'] if stats['elapsed_s'] else 0.0
+    stats['workers'] = workers
+    return stats
+
+# 解析結果の感情の分布を集計するメソッド（1チャンクずつ読むので、ファイルの大きさによらない）
+def summarize(path):
+    names = [f"{color}.{emotion}" for color in Stone.COLOR_VALUES for emotion in EMOTIONS]
+    totals = dict.fromkeys(names, 0)
+    games = moves = errors = 0
+    for kind, chunk in read_timelines(path, names + ['error']):
+        if kind == 'M':
+            moves += len(chunk[names[0]])
+            for name in names:
+                totals[name] += sum(chunk[name])
+        else:
+            games += len(chunk['error'])
+            errors += sum(1 for error in chunk['error'] if error)
+    return {'games': games, 'moves': moves, 'errors': errors, 'stones': totals}
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze SGF game collections with the EmoGo rules")
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('analyze', help="write per-move emotion timelines of SGF files to a columnar file")
+    command.add_argument('paths', nargs='+', help="SGF files or directories of them (collections are fine)")
+    command.add_argument('-o', '--output', required=True, help="timeline file to write")
+    command.add_argument('--workers', type=int, help="processes (default: one per core)")
+    command.add_argument('--scoring', default='area', choices=Scorer.RULES, help="scoring rule")
+    command.add_argument('--rows', type=int, default=8192, help="moves per chunk of the output")
+    command = commands.add_parser('summary', help="count stones by colour and emotion in a timeline file")
+    command.add_argument('path')
+    args = parser.parse_args()
+    if args.command == 'analyze':
+        stats = analyze(args.paths, args.output, args.workers, args.scoring, rows=args.rows)
+        print(f"{stats['games']} games ({stats['errors']} with errors), {stats['moves']} moves in "
+              f"{stats['elapsed_s']:.1f} s ({stats['moves_per_s']:.0f} moves/s on {stats['workers']} workers)")
+    else:
+        summary = summarize(args.path)
+        print(f"{summary['games']} games ({summary['errors']} with errors), {summary['moves']} moves")
+        for name, count in summary['stones'].items():
+            share = count / summary['moves'] if summary['moves'] else 0.0
+            print(f"{name:20} {count:12d} ({share:.2f} per move)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import mmap
+import struct
+import time
+
+# 盤面の状態をメモリマップしたファイルに公開し、他のプロセス（得点表示、配信の画面、解析など）から読めるようにするモジュール
+# 書き込みは Emogo が状態を送信するたびに行い、読み手はロックを取らずに読む（読み手が何人いても Emogo の負担は変わらない）
+# 使い方:
+#   公開: python3 emogo.py --publish /dev/shm/emogo-board
+#   表示: python3 emogo_shared.py /dev/shm/emogo-board
+#
+# ファイル形式（リトルエンディアン、40バイトのヘッダの後に盤面）
+#   ヘッダ: 'EMGB', バージョン (u16), 盤の大きさ n, m (u8), シーケンス番号 (u64),
+#           手数 (u32, パスを含む), 手番 (u8, 1: 黒, 2: 白), フラグ (u8, 1: 終局, 2: 死に石の除去待ち),
+#           アゲハマ 黒, 白 (u16), 予約 (6バイト), 局面のハッシュ値 (u64, Zobrist)
+#   盤面: n * m バイト（行ごと）。各交点は Board と同じく 色 | 感情 << 2 | 向き / 90 << 4（0 は空点）
+#
+# シーケンス番号はシーケンスロックで、書き込み中は奇数になる
+# 読み手はシーケンス番号を読み、内容をコピーし、もう一度シーケンス番号を読んで、同じ偶数なら一貫した内容とする
+
+MAGIC = b'EMGB'
+VERSION = 1
+HEADER = struct.Struct('<4sHBBQIBBHH6xQ')
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 8
+FIELDS_OFFSET = 16  # シーケンス番号より後のヘッダ
+FIELDS = struct.Struct('<IBBHH6xQ')
+FLAG_GAME_OVER = 0x01
+FLAG_WAITING_FOR_REMOVAL = 0x02
+PLAYERS = {'black': 1, 'white': 2}
+
+class BoardPublisher:
+    # 盤面の状態をファイルに書き込むクラス（書き手は1つだけ）
+    def __init__(self, path, board_size_n, board_size_m):
+        self.n = board_size_n
+        self.m = board_size_m
+        size = HEADER.size + board_size_n * board_size_m
+        with open(path, 'a+b') as f:
+            f.truncate(size)
+            self.map = mmap.mmap(f.fileno(), size)
+        self.sequence = 0
+        self.map[:] = bytes(size)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, board_size_n, board_size_m, 0, 0, 1, 0, 0, 0, 0)
+
+    # Emogo の現在の状態を書き込むメソッド
+    def publish(self, emogo):
+        board = emogo.board
+        points = board.points
+        width = board.width
+        flags = ((FLAG_GAME_OVER if emogo.game_over else 0)
+                 | (FLAG_WAITING_FOR_REMOVAL if emogo.waiting_for_dead_stones_removal else 0))
+        fields = FIELDS.pack(len(emogo.position_history) - 1, PLAYERS[emogo.current_player], flags,
+                             emogo.captures['black'], emogo.captures['white'], board.position_hash)
+        view = self.map
+        self.sequence += 1  # 奇数: 書き込み中
+        SEQUENCE.pack_into(view, SEQUENCE_OFFSET, self.sequence)
+        view[FIELDS_OFFSET:HEADER.size] = fields
+        offset = HEADER.size
+        for x in range(1, self.n + 1):
+            start = x * width + 1
+            view[offset:offset + self.m] = points[start:start + self.m]
+            offset += self.m
+        self.sequence += 1  # 偶数: 書き込み完了
+        SEQUENCE.pack_into(view, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        self.map.close()
+
+class BoardSnapshot:
+    # 読み手が取得した、一貫した盤面の状態
+    def __init__(self, n, m, sequence, fields, points):
+        self.n = n
+        self.m = m
+        self.sequence = sequence
+        self.move_number, player, flags, black_captures, white_captures, self.position_hash = FIELDS.unpack(fields)
+        self.current_player = 'black' if player == PLAYERS['black'] else 'white'
+        self.game_over = bool(flags & FLAG_GAME_OVER)
+        self.waiting_for_dead_stones_removal = bool(flags & FLAG_WAITING_FOR_REMOVAL)
+        self.captures = {'black': black_captures, 'white': white_captures}
+        self.points = points  # n * m バイト
+
+    # 交点の値を取得するメソッド（x, y は 1 始まり）
+    def point(self, x, y):
+        if not (1 <= x <= self.n and 1 <= y <= self.m):
+            raise IndexError(f"Position ({x}, {y}) is out of bounds")
+        return self.points[(x - 1) * self.m + (y - 1)]
+
+class BoardReader:
+    # 公開された盤面の状態を読むクラス（読み手はいくつあってもよい）
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ValueError(f"{path} is not a published board")
+        magic, version, self.n, self.m = struct.unpack_from('<4sHBB', self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a published board (version {VERSION})")
+        self.size = self.n * self.m
+
+    # 現在のシーケンス番号を取得するメソッド（前回の値と比べれば、変わったかどうか分かる）
+    def sequence(self):
+        return SEQUENCE.unpack_from(self.map, SEQUENCE_OFFSET)[0]
+
+    # 一貫した盤面の状態を取得するメソッド（書き込み中なら書き終わるまで読み直す）
+    def snapshot(self):
+        view = self.map
+        end = HEADER.size + self.size
+        while True:
+            before = SEQUENCE.unpack_from(view, SEQUENCE_OFFSET)[0]
+            if before & 1:
+                time.sleep(0)
+                continue
+            fields = view[FIELDS_OFFSET:HEADER.size]
+            points = view[HEADER.size:end]
+            if SEQUENCE.unpack_from(view, SEQUENCE_OFFSET)[0] == before:
+                return BoardSnapshot(self.n, self.m, before, fields, points)
+
+    def close(self):
+        self.map.close()
+
+# 盤面の状態を文字列で表すメソッド（Emogo.render_board と同じ記号）
+def render(snapshot):
+    symbols = {}
+    for emotion, black_symbol, white_symbol in ((0, 'X', 'x'), (1, 'D', 'd'), (2, '○', '●'), (3, 'O', 'o')):
+        symbols[(1, emotion)] = black_symbol
+        symbols[(2, emotion)] = white_symbol
+    rows = []
+    for x in range(1, snapshot.n + 1):
+        row = []
+        for y in range(1, snapshot.m + 1):
+            value = snapshot.point(x, y)
+            row.append(symbols.get((value & 0x03, value >> 2 & 0x03), '.'))
+        rows.append(' '.join(row))
+    return '\n'.join(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show a board published by Emogo whenever it changes")
+    parser.add_argument('path')
+    parser.add_argument('--interval', type=float, default=0.1, help="seconds between checks")
+    args = parser.parse_args()
+    reader = BoardReader(args.path)
+    last = None
+    try:
+        while True:
+            if reader.sequence() != last:
+                snapshot = reader.snapshot()
+                last = snapshot.sequence
+                state = 'game over' if snapshot.game_over else f"{snapshot.current_player} to play"
+                print(f"# move {snapshot.move_number}, {state}, captures black {snapshot.captures['black']} "
+                      f"white {snapshot.captures['white']}, position {snapshot.position_hash:016X}")
+                print(render(snapshot))
+                print()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+if __name__ == "__main__":
+    main()